@@ -0,0 +1,69 @@
+"""
+Compara el rendimiento del backend de embeddings HTTP (Hugging Face) con el
+backend local (ONNX en CPU) sobre textos del tamaño de un fragmento.
+
+Uso:
+    python bench_embeddings.py [número de textos] [tamaño de lote]
+
+Requiere HF_API_URL/HF_API_KEY para el backend HTTP y el modelo ONNX de
+EMBEDDING_LOCAL_MODEL_PATH para el local; el que no esté disponible se omite.
+"""
+import random
+import statistics
+import sys
+import time
+import numpy as np
+import embeddings
+
+
+def synthetic_texts(count, words=300, seed=0):
+    rng = random.Random(seed)
+    vocabulary = ["el", "gobierno", "anuncia", "hoy", "una", "nueva", "medida", "económica", "para", "España"]
+    return [" ".join(rng.choice(vocabulary) for _ in range(words)) + f" {i}." for i in range(count)]
+
+
+def run(backend, texts, batch_size):
+    latencies = []
+    vectors = []
+    start = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        batch_start = time.perf_counter()
+        vectors.extend(backend.embed(texts[i:i + batch_size]))
+        latencies.append(time.perf_counter() - batch_start)
+    total = time.perf_counter() - start
+    return total, latencies, vectors
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    texts = synthetic_texts(count)
+
+    backends = [("http", embeddings.HTTPEmbeddingBackend)]
+    try:
+        import local_embeddings
+        backends.append(("local", local_embeddings.LocalEmbeddingBackend))
+    except ImportError as e:
+        print(f"Backend local no disponible: {e}")
+
+    results = {}
+    for name, factory in backends:
+        try:
+            backend = factory()
+            backend.embed(texts[:1])  # calentamiento
+            total, latencies, vectors = run(backend, texts, batch_size)
+        except Exception as e:
+            print(f"{name}: omitido ({e})")
+            continue
+        results[name] = np.asarray(vectors, dtype=np.float32)
+        p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+        print(f"{name:>5}: {count / total:.1f} textos/s | lote p50 {statistics.median(latencies):.3f} s, p95 {p95:.3f} s")
+
+    if len(results) == 2:
+        similarity = np.sum(results["http"] * results["local"], axis=1)
+        print(f"Similitud coseno media entre backends: {similarity.mean():.4f} (mín. {similarity.min():.4f})")
+        print(f"Norma media local: {np.linalg.norm(results['local'], axis=1).mean():.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Compara el extractor anterior (BeautifulSoup + html.parser sobre el documento
+completo) con extractors.py sobre páginas HTML guardadas en disco.
+
+Uso:
+    python bench_extractors.py [carpeta_con_html] [repeticiones]
+
+Por defecto usa fixtures/extractors, con dos páginas por periódico que reproducen
+la estructura de sus artículos. El nombre de cada fichero debe empezar por el
+dominio del periódico (p.ej. www.larazon.es_articulo.html) para elegir el
+extractor registrado.
+"""
+import os
+import sys
+import time
+from bs4 import BeautifulSoup
+import extractors
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "extractors")
+
+
+def legacy_extract_article_text(content, min_paragraph_len=100):
+    soup = BeautifulSoup(content, "html.parser")
+    article = soup.find("article")
+    if article:
+        paragraphs = article.find_all("p")
+    else:
+        paragraphs = soup.find_all("p")
+    text = "\n".join(
+        p.get_text().strip()
+        for p in paragraphs
+        if len(p.get_text().strip()) > min_paragraph_len
+    )
+    return text.strip()
+
+
+def legacy_extract_section_text(content, min_paragraph_len=100):
+    soup = BeautifulSoup(content, "html.parser")
+    sections = soup.find_all("section")
+    paragraphs = []
+    for section in sections:
+        paragraphs.extend(section.find_all("p"))
+    if not paragraphs:
+        paragraphs = soup.find_all("p")
+    text = "\n".join(
+        p.get_text().strip()
+        for p in paragraphs
+        if len(p.get_text().strip()) > min_paragraph_len
+    )
+    return text.strip()
+
+
+LEGACY = {
+    extractors.extract_article_text: legacy_extract_article_text,
+    extractors.extract_section_text: legacy_extract_section_text,
+}
+
+
+def load_pages(directory):
+    """
+    Devuelve [(nombre, contenido)] de los ficheros HTML de directory.
+    """
+    pages = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith((".html", ".htm")):
+            with open(os.path.join(directory, name), "rb") as f:
+                pages.append((name, f.read()))
+    return pages
+
+
+def benchmark(pages, repeat):
+    timings = {"anterior": 0.0, "nuevo": 0.0}
+    mismatches = []
+    for name, content in pages:
+        extractor = extractors.get_extractor(f"https://{name.split('_', 1)[0]}/")
+        legacy = LEGACY[extractor]
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            expected = legacy(content)
+        timings["anterior"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = extractor(content)
+        timings["nuevo"] += time.perf_counter() - start
+
+        if result != expected:
+            mismatches.append(name)
+    return timings, mismatches
+
+
+def main():
+    directory = sys.argv[1] if len(sys.argv) > 1 else FIXTURES_DIR
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    pages = load_pages(directory)
+    if not pages:
+        print(f"No hay ficheros HTML en {directory}")
+        sys.exit(1)
+
+    timings, mismatches = benchmark(pages, repeat)
+    total_bytes = sum(len(content) for _, content in pages) * repeat
+    print(f"Parser: {extractors.PARSER} | {len(pages)} páginas x {repeat} repeticiones")
+    for label, seconds in timings.items():
+        print(f"{label:>9}: {seconds:.3f} s ({total_bytes / seconds / 1e6:.1f} MB/s)")
+    print(f"Aceleración: x{timings['anterior'] / timings['nuevo']:.2f}")
+    if mismatches:
+        print(f"Salida distinta en {len(mismatches)} páginas: {', '.join(mismatches)}")
+
+
+if __name__ == "__main__":
+    main()
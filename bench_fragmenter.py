@@ -0,0 +1,83 @@
+"""
+Compara el fragmentador anterior (re.split + listas de palabras) con
+fragmenter.py sobre artículos largos.
+
+Uso:
+    python bench_fragmenter.py [fichero.txt] [repeticiones]
+
+Sin fichero se genera un artículo sintético de unas 60.000 palabras.
+"""
+import random
+import re
+import sys
+import time
+import fragmenter
+
+
+def legacy_split_text_into_fragments(texto, max_words=340, min_words=80):
+    sentences = re.split(r'(?<=[.!?])\s+', texto.strip())
+    fragments = []
+    current_fragment = []
+    current_word_count = 0
+    for sentence in sentences:
+        sentence_words = sentence.split()
+        word_count = len(sentence_words)
+        if word_count > max_words:
+            if current_fragment:
+                fragments.append(' '.join(current_fragment))
+                current_fragment = []
+                current_word_count = 0
+            fragments.append(sentence)
+        elif current_word_count + word_count <= max_words:
+            current_fragment.extend(sentence_words)
+            current_word_count += word_count
+        else:
+            if current_word_count >= min_words:
+                fragments.append(' '.join(current_fragment))
+                current_fragment = sentence_words
+                current_word_count = word_count
+            else:
+                current_fragment.extend(sentence_words)
+                current_word_count += word_count
+    if current_fragment:
+        fragments.append(' '.join(current_fragment))
+    return fragments
+
+
+def synthetic_article(words=60000, seed=0):
+    rng = random.Random(seed)
+    vocabulary = ["el", "gobierno", "anuncia", "hoy", "una", "nueva", "medida", "económica", "para", "España"]
+    parts = []
+    for i in range(words):
+        parts.append(rng.choice(vocabulary))
+        if rng.random() < 0.06:
+            parts[-1] += rng.choice([".", ".", "!", "?"])
+            if rng.random() < 0.2:
+                parts[-1] += "\n"
+    return " ".join(parts)
+
+
+def timed(func, text, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(text)
+    return time.perf_counter() - start, result
+
+
+def main():
+    text = open(sys.argv[1], encoding="utf-8").read() if len(sys.argv) > 1 else synthetic_article()
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    legacy_seconds, expected = timed(legacy_split_text_into_fragments, text, repeat)
+    new_seconds, result = timed(lambda t: list(fragmenter.iter_fragments(t)), text, repeat)
+
+    print(f"{len(text.split())} palabras, {len(expected)} fragmentos x {repeat} repeticiones")
+    print(f" anterior: {legacy_seconds:.3f} s")
+    print(f"    nuevo: {new_seconds:.3f} s")
+    print(f"Aceleración: x{legacy_seconds / new_seconds:.2f}")
+    same = [f.split() for f in expected] == [f.split() for f in result]
+    print(f"Mismas palabras por fragmento: {'sí' if same else 'no'}")
+
+
+if __name__ == "__main__":
+    main()
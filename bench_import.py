@@ -0,0 +1,66 @@
+"""
+Mide el tiempo de arranque en frío de un módulo con `python -X importtime` y
+comprueba que no supera un presupuesto, para detectar importaciones pesadas
+(SDKs, clientes) que vuelvan a cargarse al importar main.
+
+Uso:
+    python bench_import.py [módulo] [presupuesto en ms] [número de módulos a listar]
+
+El presupuesto por defecto es IMPORT_TIME_BUDGET_MS (500 ms). Sale con código 1
+si la importación lo supera.
+"""
+import os
+import subprocess
+import sys
+
+IMPORT_TIME_BUDGET_MS = float(os.environ.get('IMPORT_TIME_BUDGET_MS', 500))
+
+
+def measure(module):
+    """
+    Importa module en un proceso nuevo y devuelve [(módulo, nivel, propio_us, acumulado_us)].
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"No se ha podido importar {module}:\n{result.stderr[-2000:]}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        # import time:  self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        # La sangría del nombre indica quién importa a quién (nivel 0 = importación directa)
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), level, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def main():
+    module = sys.argv[1] if len(sys.argv) > 1 else "main"
+    budget_ms = float(sys.argv[2]) if len(sys.argv) > 2 else IMPORT_TIME_BUDGET_MS
+    top = int(sys.argv[3]) if len(sys.argv) > 3 else 15
+
+    rows = measure(module)
+    # El arranque del intérprete (site, encodings...) no cuenta: solo la importación de
+    # module, que -X importtime escribe después de todas sus dependencias
+    end = next(i for i, (name, level, _, _) in enumerate(rows) if name == module and level == 0)
+    start = max((i for i in range(end) if rows[i][1] == 0), default=-1) + 1
+    total_ms = rows[end][3] / 1000
+
+    print(f"Dependencias más lentas al importar {module}:")
+    children = sorted((row for row in rows[start:end] if row[1] == 1), key=lambda row: -row[3])
+    for name, _, _, cumulative in children[:top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+    print(f"Total: {total_ms:.1f} ms (presupuesto {budget_ms:.0f} ms)")
+
+    if total_ms > budget_ms:
+        print("La importación supera el presupuesto.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import datetime
+import json
+import os
+import shutil
+import threading
+import resources
+
+resources.load_env()
+
+CHECKPOINT_DIR = os.environ.get('CHECKPOINT_DIR', '.cache/runs')
+
+STAGES = ["crawl", "fragment", "embed", "upsert", "select_topics", "generate", "insert", "notify"]
+
+
+def default_run_id():
+    """
+    Una ejecución por día: relanzar el mismo día reanuda la ejecución de ese día.
+    """
+    return datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d")
+
+
+class RunCheckpoint:
+    """
+    Guarda en disco la salida de cada etapa del pipeline para poder reanudar una
+    ejecución interrumpida sin repetir las etapas ya completadas.
+
+    Cada etapa terminada se guarda en <stage>.json. Las etapas con muchos elementos
+    independientes (p.ej. una generación por query e idioma) registran además cada
+    elemento terminado en <stage>.items.jsonl, de modo que al reanudar solo se
+    procesan los que faltan.
+    """
+
+    def __init__(self, run_id=None, directory=CHECKPOINT_DIR, resume=False):
+        self.run_id = run_id or default_run_id()
+        self.path = os.path.join(directory, self.run_id)
+        if not resume and os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _stage_path(self, stage):
+        return os.path.join(self.path, f"{stage}.json")
+
+    def _items_path(self, stage):
+        return os.path.join(self.path, f"{stage}.items.jsonl")
+
+    def is_done(self, stage):
+        return os.path.exists(self._stage_path(stage))
+
+    def load(self, stage):
+        with open(self._stage_path(stage), encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, stage, data=None):
+        """
+        Marca la etapa como completada guardando su salida (debe ser serializable en JSON).
+        """
+        path = self._stage_path(stage)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def get_or_set(self, key, value):
+        """
+        Devuelve el valor guardado para key en la ejecución, o guarda value si no existe.
+        Sirve para que una ejecución reanudada use los mismos parámetros (p.ej. la fecha).
+        """
+        stage = f"meta.{key}"
+        if self.is_done(stage):
+            return self.load(stage)
+        self.save(stage, value)
+        return value
+
+    def completed_items(self, stage):
+        """
+        Devuelve {clave: valor} de los elementos ya completados de una etapa.
+        """
+        items = {}
+        path = self._items_path(stage)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    # Una línea a medio escribir (proceso interrumpido) se ignora
+                    try:
+                        item = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    items[item["key"]] = item.get("value")
+        return items
+
+    def mark_item(self, stage, key, value=None):
+        line = json.dumps({"key": key, "value": value}, ensure_ascii=False)
+        with self._lock:
+            with open(self._items_path(stage), "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def item_key(query, language):
+    return f"{language}|{query}"
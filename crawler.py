@@ -0,0 +1,153 @@
+import logging
+import multiprocessing
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from urllib.parse import urlparse
+import resources
+import extractors
+import scraper
+import url_index
+
+resources.load_env()
+
+logger = logging.getLogger(__name__)
+
+# Límite global de peticiones simultáneas y límite por periódico (dominio)
+CRAWL_MAX_WORKERS = int(os.environ.get('CRAWL_MAX_WORKERS', 16))
+CRAWL_MAX_PER_DOMAIN = int(os.environ.get('CRAWL_MAX_PER_DOMAIN', 4))
+# Procesos para parsear y fragmentar (0 = parsear en los propios hilos de descarga)
+CPU_WORKERS = int(os.environ.get('CPU_WORKERS', os.cpu_count() or 1))
+# Páginas descargadas pendientes de parsear que se permiten a la vez en memoria
+CPU_MAX_PENDING_PAGES = int(os.environ.get('CPU_MAX_PENDING_PAGES', 2 * max(CPU_WORKERS, 1)))
+# Cómo se arrancan los procesos de parseo. El pool los crea desde los hilos de descarga,
+# y hacer fork de un proceso con hilos puede copiar locks tomados y bloquear al hijo:
+# forkserver (o spawn donde no existe) los arranca desde un proceso limpio
+CPU_START_METHOD = os.environ.get(
+    'CPU_START_METHOD', 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+)
+
+
+class DomainLimiter:
+    """
+    Mantiene un semáforo por dominio para no superar CRAWL_MAX_PER_DOMAIN
+    peticiones simultáneas contra el mismo periódico.
+    """
+
+    def __init__(self, max_per_domain=CRAWL_MAX_PER_DOMAIN):
+        self.max_per_domain = max_per_domain
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def get(self, url):
+        domain = urlparse(url).netloc
+        with self._lock:
+            if domain not in self._semaphores:
+                self._semaphores[domain] = threading.BoundedSemaphore(self.max_per_domain)
+            return self._semaphores[domain]
+
+
+def crawl_sections(fuentes, language="es", max_workers=CRAWL_MAX_WORKERS, max_per_domain=CRAWL_MAX_PER_DOMAIN, cpu_workers=CPU_WORKERS,
+                   index=None):
+    """
+    Descarga de forma concurrente las portadas de sección y los artículos enlazados.
+    Los hilos solo descargan; el parseo y la fragmentación se hacen en un pool de
+    cpu_workers procesos al que se envían como mucho CPU_MAX_PENDING_PAGES páginas
+    a la vez, de modo que en memoria solo están las páginas de los hilos activos.
+
+    Cada artículo se descarga una sola vez aunque lo enlacen varias secciones; sus
+    fragmentos llevan en "categories" y "sections" todas ellas y se devuelven con
+    la primera sección en la que apareció. Los artículos que no han cambiado desde
+    la ejecución anterior (ver url_index) no devuelven fragmentos.
+
+    Args:
+        fuentes: Diccionario {base_url: {path: categoria}} como el de main.main
+        language: Idioma de los fragmentos
+        max_workers: Número máximo de peticiones simultáneas en total
+        max_per_domain: Número máximo de peticiones simultáneas por dominio
+        cpu_workers: Número de procesos de parseo (0 para parsear en los hilos)
+        index: url_index.URLIndex de la ejecución (se crea uno si no se pasa)
+
+    Returns:
+        Lista de tuplas (url_seccion, categoria, fragmentos) en el mismo orden que fuentes,
+        donde fragmentos tiene el mismo formato que scraper.extract_text_fragments.
+    """
+    index = index if index is not None else url_index.URLIndex()
+    limiter = DomainLimiter(max_per_domain)
+    pending_pages = threading.BoundedSemaphore(CPU_MAX_PENDING_PAGES)
+    process_pool = ProcessPoolExecutor(
+        max_workers=cpu_workers, mp_context=multiprocessing.get_context(CPU_START_METHOD)
+    ) if cpu_workers > 0 else None
+
+    def limited(url, func, *args, **kwargs):
+        with limiter.get(url):
+            return func(*args, **kwargs)
+
+    def crawl_article(url, categoria):
+        extract = extractors.get_extractor(url)
+        try:
+            page = limited(url, scraper.fetch_article, url, extract)
+            if "text" in page:
+                text = page["text"]
+                index.set_content(url, text)
+                return scraper.build_fragments(text, url, language, categoria) if text else []
+            if process_pool:
+                with pending_pages:
+                    text, fragments = process_pool.submit(
+                        scraper.parse_page, extract, page["content"], url, language, categoria
+                    ).result()
+            else:
+                text, fragments = scraper.parse_page(extract, page["content"], url, language, categoria)
+            scraper.store_article_text(url, page, text, extract)
+            index.set_content(url, text)
+            return fragments
+        except Exception as e:
+            logger.error(f"Error al scrapear la URL: {e}")
+            return []
+
+    sections = [
+        (f"{base_url}{path}", categoria)
+        for base_url, secciones in fuentes.items()
+        for path, categoria in secciones.items()
+    ]
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # 1. Portadas de sección
+            link_futures = [
+                executor.submit(limited, section_url, scraper.get_main_article_links, section_url)
+                for section_url, _ in sections
+            ]
+
+            # 2. Artículos de cada sección, en cuanto su portada está disponible; los
+            # enlazados desde una sección anterior solo se registran en el índice
+            article_futures = defaultdict(list)
+            for (section_url, categoria), future in zip(sections, link_futures):
+                articles_urls = future.result()
+                new_urls = [url for url in articles_urls if index.claim(url, section_url, categoria)]
+                logger.info(f"Recopilados {len(articles_urls)} enlaces de {section_url} ({len(new_urls)} nuevos en la ejecución)")
+                for article_url in new_urls:
+                    article_futures[section_url].append((article_url, executor.submit(crawl_article, article_url, categoria)))
+
+            page_fragments = {
+                url: future.result()
+                for section_url, _ in sections
+                for url, future in article_futures[section_url]
+            }
+            unchanged = index.compare_with_previous()
+            if unchanged:
+                logger.info(f"{unchanged} artículos sin cambios desde la ejecución anterior.")
+
+            results = []
+            for section_url, categoria in sections:
+                fragments = []
+                for url, _ in article_futures[section_url]:
+                    if url not in index.unchanged:
+                        fragments.extend(index.annotate(url, page_fragments[url]))
+                results.append((section_url, categoria, fragments))
+    finally:
+        if process_pool:
+            process_pool.shutdown()
+
+    return results
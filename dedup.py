@@ -0,0 +1,111 @@
+import logging
+import os
+import zlib
+import numpy as np
+import resources
+
+resources.load_env()
+
+logger = logging.getLogger(__name__)
+
+# Similitud de Jaccard estimada a partir de la cual dos fragmentos se consideran el mismo texto
+DEDUP_THRESHOLD = float(os.environ.get('DEDUP_THRESHOLD', 0.8))
+DEDUP_SHINGLE_SIZE = int(os.environ.get('DEDUP_SHINGLE_SIZE', 5))
+
+# 64 permutaciones en 16 bandas de 4 filas: los pares con Jaccard a partir de ~0.5
+# suelen coincidir en alguna banda y después se comprueba el umbral real
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_rng = np.random.default_rng(1)
+# a, b < 2^31 y x < 2^32 (crc32), de modo que a * x + b no desborda uint64
+_PERM_A = _rng.integers(1, 1 << 31, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, 1 << 31, size=NUM_PERM, dtype=np.uint64)
+
+
+def shingle_hashes(text, size=DEDUP_SHINGLE_SIZE):
+    """
+    Hashes (crc32) de los n-gramas de palabras del texto, en minúsculas.
+    """
+    words = text.lower().split()
+    if len(words) <= size:
+        return np.array([zlib.crc32(" ".join(words).encode("utf-8"))], dtype=np.uint64)
+    return np.array(
+        [zlib.crc32(" ".join(words[i:i + size]).encode("utf-8")) for i in range(len(words) - size + 1)],
+        dtype=np.uint64
+    )
+
+
+def minhash_signature(text):
+    """
+    Firma MinHash (NUM_PERM valores) del texto.
+    """
+    hashes = shingle_hashes(text)
+    # (a * x + b) mod p para todas las permutaciones a la vez
+    permuted = (np.outer(_PERM_A, hashes) + _PERM_B[:, None]) % _MERSENNE_PRIME
+    return permuted.min(axis=1)
+
+
+def merge_near_duplicates(fragments, threshold=DEDUP_THRESHOLD):
+    """
+    Agrupa los fragmentos casi idénticos (p.ej. la misma noticia de agencia publicada
+    por varios periódicos) y conserva solo el primero de cada grupo.
+
+    El fragmento conservado lleva en "urls" todas las URLs de su grupo, para que
+    los artículos generados citen todas las fuentes, y en "categories" y
+    "sections" las de todos sus fragmentos.
+
+    Returns:
+        Lista de fragmentos sin casi duplicados, en el orden original
+    """
+    if len(fragments) < 2:
+        return [dict(f, urls=f.get("urls") or [f["url"]]) for f in fragments]
+
+    signatures = np.stack([minhash_signature(f["text"]) for f in fragments])
+
+    # Unión-búsqueda sobre los pares candidatos de LSH que superan el umbral
+    parent = list(range(len(fragments)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(BANDS):
+        buckets = {}
+        band_values = signatures[:, band * ROWS:(band + 1) * ROWS]
+        for i, key in enumerate(map(bytes, band_values)):
+            buckets.setdefault(key, []).append(i)
+        for members in buckets.values():
+            for position, first in enumerate(members):
+                for other in members[position + 1:]:
+                    root_first, root_other = find(first), find(other)
+                    if root_first == root_other:
+                        continue
+                    similarity = np.mean(signatures[first] == signatures[other])
+                    if similarity >= threshold:
+                        parent[max(root_first, root_other)] = min(root_first, root_other)
+
+    merged = {}
+    for i, fragment in enumerate(fragments):
+        root = find(i)
+        if root not in merged:
+            merged[root] = dict(fragment, urls=[])
+            for key in ("categories", "sections"):
+                if key in fragment:
+                    merged[root][key] = list(fragment[key])
+        for url in fragment.get("urls") or [fragment["url"]]:
+            if url not in merged[root]["urls"]:
+                merged[root]["urls"].append(url)
+        for key in ("categories", "sections"):
+            for value in fragment.get(key) or []:
+                if value not in merged[root].setdefault(key, []):
+                    merged[root][key].append(value)
+
+    removed = len(fragments) - len(merged)
+    if removed:
+        logger.info(f"Eliminados {removed} fragmentos casi duplicados de {len(fragments)}.")
+    return [merged[root] for root in sorted(merged)]
@@ -0,0 +1,198 @@
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+import telemetry
+import resources
+
+resources.load_env()
+
+logger = logging.getLogger(__name__)
+
+# Peticiones de embeddings simultáneas y upserts simultáneos en Qdrant
+EMBED_CONCURRENCY = int(os.environ.get('EMBED_CONCURRENCY', 3))
+UPSERT_CONCURRENCY = int(os.environ.get('UPSERT_CONCURRENCY', 2))
+
+# Límites del tamaño de lote adaptativo
+EMBED_MIN_BATCH = int(os.environ.get('EMBED_MIN_BATCH', 4))
+EMBED_MAX_BATCH = int(os.environ.get('EMBED_MAX_BATCH', 128))
+EMBED_MAX_PAYLOAD_BYTES = int(os.environ.get('EMBED_MAX_PAYLOAD_BYTES', 512 * 1024))
+# Latencia objetivo (segundos) por petición de embeddings
+EMBED_TARGET_LATENCY = float(os.environ.get('EMBED_TARGET_LATENCY', 4))
+# Intentos para un fragmento individual antes de darlo por perdido
+EMBED_MAX_ATTEMPTS = int(os.environ.get('EMBED_MAX_ATTEMPTS', 3))
+EMBED_RATE_LIMIT_BACKOFF = float(os.environ.get('EMBED_RATE_LIMIT_BACKOFF', 5))
+# Espera inicial (segundos, se duplica en cada fallo seguido) cuando falla todo el
+# backend (5xx, timeout, error de conexión), y fallos seguidos tras los que se aborta
+EMBED_BACKEND_BACKOFF = float(os.environ.get('EMBED_BACKEND_BACKOFF', 2))
+EMBED_MAX_BACKEND_BACKOFF = float(os.environ.get('EMBED_MAX_BACKEND_BACKOFF', 60))
+EMBED_MAX_CONSECUTIVE_FAILURES = int(os.environ.get('EMBED_MAX_CONSECUTIVE_FAILURES', 6))
+
+
+class AdaptiveBatchSize:
+    """
+    Ajusta el tamaño de lote según la latencia observada, el tamaño del payload
+    y las respuestas 413 (payload demasiado grande) y 429 (límite de peticiones).
+    """
+
+    def __init__(self, initial, min_size=EMBED_MIN_BATCH, max_size=EMBED_MAX_BATCH,
+                 max_payload_bytes=EMBED_MAX_PAYLOAD_BYTES, target_latency=EMBED_TARGET_LATENCY):
+        self.min_size = min(min_size, initial)
+        self.max_size = max(max_size, initial)
+        self.size = initial
+        self.max_payload_bytes = max_payload_bytes
+        self.target_latency = target_latency
+
+    def take(self, queue):
+        """
+        Saca de la cola el siguiente lote respetando el tamaño y el límite de bytes.
+        """
+        batch = []
+        payload_bytes = 0
+        while queue and len(batch) < self.size:
+            item_bytes = len(queue[0]["text"].encode("utf-8"))
+            if batch and payload_bytes + item_bytes > self.max_payload_bytes:
+                break
+            batch.append(queue.popleft())
+            payload_bytes += item_bytes
+        return batch
+
+    def on_success(self, batch_len, latency):
+        if batch_len < self.size:
+            return
+        if latency < self.target_latency / 2:
+            self.size = min(self.max_size, int(self.size * 1.5) + 1)
+        elif latency > self.target_latency:
+            self.size = max(self.min_size, self.size // 2)
+
+    def on_too_large(self, batch_len, payload_bytes):
+        self.size = max(1, min(self.size, batch_len) // 2)
+        self.min_size = min(self.min_size, self.size)
+        self.max_payload_bytes = max(1, min(self.max_payload_bytes, payload_bytes) // 2)
+
+    def on_rate_limited(self):
+        self.size = max(self.min_size, self.size // 2)
+
+
+def _status_code(error):
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code
+    return None
+
+
+def _is_backend_failure(error, status):
+    """
+    True si el error es del backend en su conjunto y no de algún texto del lote:
+    dividir el lote no ayuda, hay que esperar y reintentarlo entero.
+    """
+    if status is not None:
+        return status >= 500
+    return isinstance(error, (requests.Timeout, requests.ConnectionError))
+
+
+def embed_and_upsert(items, embed, upsert, batch_size=30):
+    """
+    Calcula embeddings y los inserta en un pipeline: mantiene varias peticiones
+    de embeddings en curso y solapa los upserts con ellas.
+
+    Un lote rechazado por su tamaño (413) o por algún texto (resto de errores 4xx
+    o respuestas inválidas) se divide en dos y se reintenta; un fragmento
+    individual se reintenta hasta EMBED_MAX_ATTEMPTS veces y, si sigue fallando,
+    se avisa de que se pierde. Ante un 429 o un fallo del backend (5xx, timeout,
+    error de conexión) el lote se reintenta entero tras una espera, y tras
+    EMBED_MAX_CONSECUTIVE_FAILURES fallos seguidos se aborta con RuntimeError.
+
+    Args:
+        items: Lista de diccionarios con al menos "text"
+        embed: Función que recibe una lista de textos y devuelve sus embeddings o lanza excepción
+        upsert: Función que recibe una lista de (item, embedding) y devuelve un resultado
+        batch_size: Tamaño de lote inicial
+
+    Returns:
+        Tupla (resultados de upsert, items perdidos)
+    """
+    sizer = AdaptiveBatchSize(batch_size)
+    queue = deque({"item": item, "text": item["text"], "attempts": 0} for item in items)
+    # Lotes ya divididos tras un fallo, que se reintentan tal cual antes que el resto
+    retries = deque()
+    lost = []
+    upsert_results = []
+    paused_until = 0.0
+    consecutive_failures = 0
+
+    def timed_embed(batch):
+        start = time.perf_counter()
+        vectors = embed([entry["text"] for entry in batch])
+        return vectors, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY) as embed_executor, \
+            ThreadPoolExecutor(max_workers=UPSERT_CONCURRENCY) as upsert_executor:
+        in_flight = {}
+        upsert_futures = []
+
+        while retries or queue or in_flight:
+            now = time.monotonic()
+            while (retries or queue) and len(in_flight) < EMBED_CONCURRENCY and now >= paused_until:
+                batch = retries.popleft() if retries else sizer.take(queue)
+                in_flight[embed_executor.submit(timed_embed, batch)] = batch
+
+            if not in_flight:
+                time.sleep(max(paused_until - now, 0))
+                continue
+
+            done, _ = wait(in_flight, timeout=max(paused_until - now, 0) or None, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = in_flight.pop(future)
+                try:
+                    vectors, latency = future.result()
+                except Exception as e:
+                    status = _status_code(e)
+                    telemetry.increment("embedding_batch_errors_total", status=status or "error")
+                    if status == 429 or _is_backend_failure(e, status):
+                        consecutive_failures += 1
+                        if consecutive_failures >= EMBED_MAX_CONSECUTIVE_FAILURES:
+                            raise RuntimeError(
+                                f"El backend de embeddings ha fallado {consecutive_failures} veces seguidas "
+                                f"(último error: {e}); se aborta la ingesta."
+                            ) from e
+                        if status == 429:
+                            sizer.on_rate_limited()
+                            backoff = EMBED_RATE_LIMIT_BACKOFF
+                        else:
+                            backoff = min(EMBED_MAX_BACKEND_BACKOFF, EMBED_BACKEND_BACKOFF * 2 ** (consecutive_failures - 1))
+                        logger.warning(f"Error del backend de embeddings ({e}); se reintenta el lote en {backoff:.0f} s.")
+                        paused_until = max(paused_until, time.monotonic() + backoff)
+                        retries.appendleft(batch)
+                        continue
+
+                    if status == 413:
+                        payload_bytes = sum(len(entry["text"].encode("utf-8")) for entry in batch)
+                        sizer.on_too_large(len(batch), payload_bytes)
+
+                    if len(batch) > 1:
+                        middle = len(batch) // 2
+                        logger.warning(f"Error en lote de {len(batch)} embeddings ({e}); se divide y se reintenta.")
+                        retries.appendleft(batch[middle:])
+                        retries.appendleft(batch[:middle])
+                    else:
+                        entry = batch[0]
+                        entry["attempts"] += 1
+                        if entry["attempts"] < EMBED_MAX_ATTEMPTS and status != 413:
+                            retries.append(batch)
+                        else:
+                            logger.error(f"Fragmento descartado tras {entry['attempts']} intentos ({e}): {entry['text'][:80]!r}")
+                            lost.append(entry["item"])
+                            telemetry.increment("embedding_fragments_lost_total")
+                    continue
+
+                consecutive_failures = 0
+                sizer.on_success(len(batch), latency)
+                pairs = [(entry["item"], vector) for entry, vector in zip(batch, vectors)]
+                upsert_futures.append(upsert_executor.submit(upsert, pairs))
+
+        for future in upsert_futures:
+            upsert_results.append(future.result())
+
+    return upsert_results, lost
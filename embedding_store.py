@@ -0,0 +1,150 @@
+import json
+import logging
+import os
+import threading
+import time
+import numpy as np
+import telemetry
+import resources
+
+resources.load_env()
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_DIR = os.environ.get('EMBEDDING_CACHE_DIR', '.cache/embeddings')
+# Número máximo de vectores guardados; por encima se eliminan los usados hace más tiempo
+EMBEDDING_CACHE_MAX_ROWS = int(os.environ.get('EMBEDDING_CACHE_MAX_ROWS', 50000))
+# Los vectores no usados en este tiempo (segundos) se eliminan
+EMBEDDING_CACHE_MAX_AGE = float(os.environ.get('EMBEDDING_CACHE_MAX_AGE', 14 * 24 * 3600))
+
+
+class EmbeddingStore:
+    """
+    Caché de embeddings direccionada por contenido (el id uuid5 de cada fragmento).
+
+    Los vectores se guardan como una matriz float32 mapeada en memoria
+    (vectors.f32) y un índice JSON (index.json) con la fila y la fecha de
+    último uso de cada id. El índice lleva la versión del modelo, de forma
+    que al cambiar de modelo la caché se invalida entera.
+    """
+
+    def __init__(self, directory, model_version, max_rows=EMBEDDING_CACHE_MAX_ROWS, max_age=EMBEDDING_CACHE_MAX_AGE):
+        self.directory = directory
+        self.model_version = model_version
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.index_path = os.path.join(directory, "index.json")
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._load()
+
+    def _load(self):
+        self.dim = None
+        self.rows = {}  # id -> [fila, último uso]
+        self.n_rows = 0
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("model") != self.model_version:
+            logger.warning("Versión del modelo de embeddings distinta: se invalida la caché.")
+            return
+        self.dim = index["dim"]
+        self.rows = index["rows"]
+        self.n_rows = index["n_rows"]
+        # Las filas añadidas tras el último save (proceso interrumpido) no están en el
+        # índice: se descartan para que add no asigne a ids nuevos vectores huérfanos
+        expected_size = self.n_rows * self.dim * np.dtype(np.float32).itemsize
+        if os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path) > expected_size:
+            logger.warning("Vectores sin indexar de una ejecución interrumpida: se descartan.")
+            os.truncate(self.vectors_path, expected_size)
+
+    def _get_matrix(self):
+        if self._matrix is None and self.n_rows:
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self.n_rows, self.dim))
+        return self._matrix
+
+    def lookup(self, ids):
+        """
+        Devuelve un diccionario {id: vector} con los ids presentes en la caché.
+        """
+        now = time.time()
+        found = {}
+        with self._lock:
+            matrix = self._get_matrix()
+            for id in ids:
+                entry = self.rows.get(id)
+                if entry is not None:
+                    entry[1] = now
+                    found[id] = matrix[entry[0]].tolist()
+        telemetry.increment("cache_requests_total", len(found), cache="embeddings", result="hit")
+        telemetry.increment("cache_requests_total", len(ids) - len(found), cache="embeddings", result="miss")
+        return found
+
+    def add(self, ids, vectors):
+        if not ids:
+            return
+        array = np.asarray(vectors, dtype=np.float32)
+        now = time.time()
+        with self._lock:
+            if self.dim is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self.dim = array.shape[1]
+                # Se descarta cualquier fichero de vectores de un modelo anterior
+                open(self.vectors_path, "wb").close()
+            new = [(id, vector) for id, vector in zip(ids, array) if id not in self.rows]
+            if not new:
+                return
+            with open(self.vectors_path, "ab") as f:
+                for id, vector in new:
+                    f.write(vector.tobytes())
+                    self.rows[id] = [self.n_rows, now]
+                    self.n_rows += 1
+            self._matrix = None
+
+    def save(self):
+        """
+        Aplica la expulsión por antigüedad y LRU, compacta la matriz y guarda el índice.
+        """
+        with self._lock:
+            if self.dim is None:
+                return
+            cutoff = time.time() - self.max_age
+            kept = sorted(
+                ((id, entry) for id, entry in self.rows.items() if entry[1] >= cutoff),
+                key=lambda item: item[1][1],
+                reverse=True
+            )[:self.max_rows]
+
+            if len(kept) < self.n_rows:
+                matrix = self._get_matrix()
+                compacted = np.empty((len(kept), self.dim), dtype=np.float32)
+                rows = {}
+                for new_row, (id, (old_row, last_used)) in enumerate(kept):
+                    compacted[new_row] = matrix[old_row]
+                    rows[id] = [new_row, last_used]
+                self._matrix = None
+                del matrix
+                tmp_path = self.vectors_path + ".tmp"
+                compacted.tofile(tmp_path)
+                os.replace(tmp_path, self.vectors_path)
+                self.rows = rows
+                self.n_rows = len(kept)
+
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"model": self.model_version, "dim": self.dim, "n_rows": self.n_rows, "rows": self.rows}, f)
+            os.replace(tmp_path, self.index_path)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store(model_version):
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = EmbeddingStore(EMBEDDING_CACHE_DIR, model_version)
+        return _store
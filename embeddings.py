@@ -1,23 +1,42 @@
+import logging
 import requests
 import os
-from dotenv import load_dotenv
+import threading
+import http_client
+import resources
 
-load_dotenv()
+resources.load_env()
+
+logger = logging.getLogger(__name__)
 
 HF_API_URL = os.environ.get('HF_API_URL')
 HF_API_KEY = os.environ.get('HF_API_KEY')
+# "http" usa la API de Hugging Face; "local" calcula los embeddings en la CPU (ver local_embeddings.py)
+EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'http')
+# Identifica el modelo que genera los embeddings; al cambiarlo se invalida la caché de embeddings
+EMBEDDING_MODEL_VERSION = os.environ.get('EMBEDDING_MODEL_VERSION', HF_API_URL or '')
+HF_POOL_MAXSIZE = int(os.environ.get('HF_POOL_MAXSIZE', 4))
+
+http_client.configure_host(HF_API_URL, HF_POOL_MAXSIZE)
 
 # Si se quiere hacer el embedding de una query se debe añadir antes una oración con la instrucción que describe la tarea p.ej. "Given a web search query, retrieve relevant passages that answer the query \n Query: how much protein should a female eat
 # Retrieve semantically similar text.
 def get_detailed_instruct(query, task_description = "Given a web search query, retrieve relevant passages related to the query"):
     return f'Instruct: {task_description}\nQuery:{query}'
 
-# Obtiene el embedding de un texto utilizando la API de Hugging Face
+# Obtiene el embedding de un texto utilizando el backend configurado
 def get_embedding(textInput):
 
     if not textInput:
         raise ValueError("textInput no puede estar vacío")
 
+    if EMBEDDING_BACKEND != "http":
+        try:
+            return get_backend().embed([textInput])[0]
+        except Exception as e:
+            logger.error(f"Error inesperado: {e}")
+            return None
+
     payload = {
         "inputs": textInput,
         "parameters":
@@ -31,25 +50,70 @@ def get_embedding(textInput):
     }
 
     try:
-        response = requests.post(HF_API_URL, headers=headers, json=payload)
+        response = http_client.post(HF_API_URL, headers=headers, json=payload)
         response.raise_for_status()  # Lanza error si status_code >= 400
         return response.json()
     
     except requests.Timeout:
-        print("Error: la solicitud a HuggingFace tardó demasiado.")
+        logger.error("Error: la solicitud a HuggingFace tardó demasiado.")
     except requests.RequestException as e:
-        print(f"Error en la solicitud: {e}")
+        logger.error(f"Error en la solicitud: {e}")
     except Exception as e:
-        print(f"Error inesperado: {e}")
+        logger.error(f"Error inesperado: {e}")
 
     return None
 
-# Obtiene los embeddings de un lote de textos (fragmentos de texto) utilizando la API de Hugging Face
-def get_embeddings_batch(texts):
+class HTTPEmbeddingBackend:
+    """
+    Backend de embeddings que llama al endpoint de inferencia de Hugging Face.
+    """
+
+    name = "http"
+    version = EMBEDDING_MODEL_VERSION
+
+    def embed(self, texts):
+        return request_hf_embeddings_batch(texts)
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """
+    Devuelve el backend de embeddings configurado en EMBEDDING_BACKEND, creándolo en el primer uso.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if EMBEDDING_BACKEND == "local":
+                    import local_embeddings
+                    _backend = local_embeddings.LocalEmbeddingBackend()
+                else:
+                    _backend = HTTPEmbeddingBackend()
+    return _backend
+
+def get_model_version():
+    """
+    Etiqueta del modelo del backend activo, usada para invalidar la caché de embeddings.
+    """
+    return get_backend().version
+
+# Solicita los embeddings de un lote de textos al backend configurado.
+# A diferencia de get_embeddings_batch, lanza la excepción en caso de error
+# (requests.HTTPError conserva el status_code, p.ej. 413 o 429).
+def request_embeddings_batch(texts):
 
     if not texts:
         raise ValueError("texts debe ser una lista no vacía de strings")
 
+    result = get_backend().embed(texts)
+    if not isinstance(result, list) or len(result) != len(texts):
+        raise ValueError(f"Respuesta inesperada del backend de embeddings: se esperaban {len(texts)} embeddings")
+    return result
+
+# Solicita los embeddings de un lote de textos a la API de Hugging Face
+def request_hf_embeddings_batch(texts):
+
     payload = {
         "inputs": texts,
         "parameters": {
@@ -62,16 +126,24 @@ def get_embeddings_batch(texts):
         "Content-Type": "application/json"
     }
 
+    response = http_client.post(HF_API_URL, headers=headers, json=payload)
+    response.raise_for_status()  # Lanza error si status_code >= 400
+    return response.json()
+
+# Obtiene los embeddings de un lote de textos (fragmentos de texto) utilizando el backend configurado
+def get_embeddings_batch(texts):
+
+    if not texts:
+        raise ValueError("texts debe ser una lista no vacía de strings")
+
     try:
-        response = requests.post(HF_API_URL, headers=headers, json=payload)
-        response.raise_for_status()  # Lanza error si status_code >= 400
-        return response.json()
-    
+        return request_embeddings_batch(texts)
+
     except requests.Timeout:
-        print("Error: la solicitud a HuggingFace tardó demasiado.")
+        logger.error("Error: la solicitud a HuggingFace tardó demasiado.")
     except requests.RequestException as e:
-        print(f"Error en la solicitud: {e}")
+        logger.error(f"Error en la solicitud: {e}")
     except Exception as e:
-        print(f"Error inesperado: {e}")
+        logger.error(f"Error inesperado: {e}")
 
     return [None] * len(texts)
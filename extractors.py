@@ -0,0 +1,66 @@
+from urllib.parse import urlparse
+from bs4 import BeautifulSoup, SoupStrainer
+
+# Se usa lxml (en C) si está instalado; si no, el parser de la librería estándar
+try:
+    import lxml  # noqa: F401
+    PARSER = "lxml"
+except ImportError:
+    PARSER = "html.parser"
+
+
+def parse_only(content, tag):
+    """
+    Parsea únicamente las etiquetas tag (y su contenido) del documento.
+    """
+    return BeautifulSoup(content, PARSER, parse_only=SoupStrainer(tag))
+
+
+# Filtra y concatena párrafos decentes, calculando el texto de cada uno una sola vez
+def join_paragraphs(paragraphs, min_paragraph_len=100):
+    texts = (p.get_text().strip() for p in paragraphs)
+    return "\n".join(
+        text
+        for text in texts
+        if len(text) > min_paragraph_len  # descarta textos irrelevantes
+    ).strip()
+
+
+# Extrae el texto útil de un artículo a partir del HTML descargado
+def extract_article_text(content, min_paragraph_len=100):
+    # Intenta extraer desde <article> si existe
+    article = parse_only(content, "article").find("article")
+    if article:
+        paragraphs = article.find_all("p")
+    else:
+        paragraphs = parse_only(content, "p").find_all("p")
+
+    return join_paragraphs(paragraphs, min_paragraph_len)
+
+
+# Extrae el texto útil de las etiquetas <section> a partir del HTML descargado
+def extract_section_text(content, min_paragraph_len=100):
+    # Extrae todos los <section> y sus <p>
+    paragraphs = []
+    for section in parse_only(content, "section").find_all("section"):
+        paragraphs.extend(section.find_all("p"))
+
+    # Si no hay <section>, usa todos los <p> del documento
+    if not paragraphs:
+        paragraphs = parse_only(content, "p").find_all("p")
+
+    return join_paragraphs(paragraphs, min_paragraph_len)
+
+
+# Extractor por dominio; los que no aparecen usan extract_article_text
+EXTRACTORS = {
+    "www.larazon.es": extract_section_text,
+}
+
+
+def register_extractor(domain, extractor):
+    EXTRACTORS[domain] = extractor
+
+
+def get_extractor(url):
+    return EXTRACTORS.get(urlparse(url).netloc, extract_article_text)
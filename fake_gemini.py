@@ -0,0 +1,184 @@
+"""
+Servidor HTTP falso que emula la parte de la API de Gemini que usa el modo batch:
+subida de ficheros, creación y consulta de trabajos batch y descarga de resultados.
+Sirve para probar gemini.generate_articles_batch sin red ni cuota, apuntando
+GEMINI_BASE_URL a su url.
+
+Uso:
+    with FakeGeminiServer() as server:
+        os.environ["GEMINI_BASE_URL"] = server.url
+        ...
+
+Cada trabajo pasa por JOB_STATE_PENDING y JOB_STATE_RUNNING durante polls_until_done
+consultas antes de terminar. responder(key, request) devuelve el texto de la respuesta
+a cada línea del JSONL, o None para que esa petición falle.
+"""
+import itertools
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+def default_responder(key, request):
+    return json.dumps({"title": f"Artículo {key}", "body": "Texto generado por el servidor falso."}, ensure_ascii=False)
+
+
+class FakeGeminiServer:
+
+    def __init__(self, responder=default_responder, polls_until_done=2, host="127.0.0.1", port=0):
+        self.responder = responder
+        self.polls_until_done = polls_until_done
+        self.files = {}  # nombre -> bytes
+        self.batches = {}  # nombre -> {"model", "display_name", "input", "polls", "output"}
+        self.requests = []  # (método, ruta) de cada petición recibida
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _next_id(self):
+        with self._lock:
+            return next(self._ids)
+
+    def _run_batch(self, batch):
+        """
+        Genera el fichero de resultados del trabajo a partir de su JSONL de entrada.
+        """
+        lines = []
+        for line in self.files[batch["input"]].decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            text = self.responder(item["key"], item["request"])
+            if text is None:
+                lines.append({"key": item["key"], "error": {"code": 500, "message": "Error simulado"}})
+            else:
+                lines.append({
+                    "key": item["key"],
+                    "response": {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]},
+                })
+        output = f"files/batch-output-{self._next_id()}"
+        self.files[output] = "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines).encode("utf-8")
+        return output
+
+    def _batch_resource(self, name):
+        batch = self.batches[name]
+        if batch["polls"] < self.polls_until_done:
+            state = "BATCH_STATE_PENDING" if batch["polls"] == 0 else "BATCH_STATE_RUNNING"
+        else:
+            state = "BATCH_STATE_SUCCEEDED"
+            if batch["output"] is None:
+                batch["output"] = self._run_batch(batch)
+        metadata = {
+            "@type": "type.googleapis.com/google.ai.generativelanguage.v1main.GenerateContentBatch",
+            "model": batch["model"],
+            "displayName": batch["display_name"],
+            "state": state,
+        }
+        if batch["output"]:
+            metadata["output"] = {"responsesFile": batch["output"]}
+        return {"name": name, "metadata": metadata, "done": state == "BATCH_STATE_SUCCEEDED"}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, body, status=200, headers=None):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _read_body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                return self.rfile.read(length) if length else b""
+
+            def do_POST(self):
+                path = urlparse(self.path).path
+                server.requests.append(("POST", path))
+                body = self._read_body()
+
+                # Subida resumable: la primera petición devuelve la url a la que se envía el contenido
+                if path.endswith("/files") and "start" in self.headers.get("X-Goog-Upload-Command", ""):
+                    name = f"files/upload-{server._next_id()}"
+                    server.files[name] = b""
+                    return self._send_json({}, headers={
+                        "X-Goog-Upload-URL": f"{server.url}/upload-session/{name}",
+                        "X-Goog-Upload-Status": "active",
+                    })
+                if path.startswith("/upload-session/"):
+                    name = path[len("/upload-session/"):]
+                    server.files[name] += body
+                    status = "final" if "finalize" in self.headers.get("X-Goog-Upload-Command", "") else "active"
+                    return self._send_json(
+                        {"file": {"name": name, "sizeBytes": str(len(server.files[name])), "state": "ACTIVE"}},
+                        headers={"X-Goog-Upload-Status": status},
+                    )
+                if path.endswith(":batchGenerateContent"):
+                    request = json.loads(body or b"{}").get("batch", {})
+                    name = f"batches/{server._next_id()}"
+                    server.batches[name] = {
+                        "model": path.split("/models/", 1)[-1].split(":", 1)[0],
+                        "display_name": request.get("displayName"),
+                        "input": request.get("inputConfig", {}).get("fileName"),
+                        "polls": 0,
+                        "output": None,
+                    }
+                    return self._send_json(server._batch_resource(name))
+                self._send_json({"error": {"code": 404, "message": f"Ruta no emulada: {path}"}}, status=404)
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                server.requests.append(("GET", path))
+
+                if path.endswith(":download"):
+                    name = "files/" + path.rsplit("/files/", 1)[-1][:-len(":download")]
+                    data = server.files.get(name)
+                    if data is None:
+                        return self._send_json({"error": {"code": 404, "message": f"Fichero no encontrado: {name}"}}, status=404)
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/octet-stream")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                    return
+                if "/batches/" in path:
+                    name = "batches/" + path.rsplit("/batches/", 1)[-1]
+                    if name not in server.batches:
+                        return self._send_json({"error": {"code": 404, "message": f"Trabajo no encontrado: {name}"}}, status=404)
+                    server.batches[name]["polls"] += 1
+                    return self._send_json(server._batch_resource(name))
+                self._send_json({"error": {"code": 404, "message": f"Ruta no emulada: {path}"}}, status=404)
+
+        return Handler
@@ -0,0 +1,144 @@
+import os
+import re
+from collections import deque
+import resources
+
+resources.load_env()
+
+# Si se define, los límites de los fragmentos se cuentan en tokens de este tokenizer de Hugging Face
+FRAGMENT_TOKENIZER = os.environ.get('FRAGMENT_TOKENIZER')
+FRAGMENT_MAX_TOKENS = int(os.environ.get('FRAGMENT_MAX_TOKENS', 480))
+FRAGMENT_MIN_TOKENS = int(os.environ.get('FRAGMENT_MIN_TOKENS', 110))
+# Oraciones del final de un fragmento que se repiten al principio del siguiente
+FRAGMENT_OVERLAP = int(os.environ.get('FRAGMENT_OVERLAP', 0))
+
+# Puntuación fuerte seguida de espacios; sin lookbehind, que es bastante más lento
+_SENTENCE_BOUNDARY = re.compile(r'[.!?]\s+')
+_NON_SPACE = re.compile(r'\S')
+
+
+def count_words(text, start, end):
+    """
+    Cuenta las palabras de text[start:end].
+    """
+    # str.split en C es más rápido que recorrer las palabras con finditer
+    return len(text[start:end].split())
+
+
+def make_token_counter(encode):
+    """
+    Crea un contador compatible con iter_fragment_spans a partir de una función
+    que tokeniza un texto y devuelve la lista de tokens.
+    """
+    def count_tokens(text, start, end):
+        return len(encode(text[start:end]))
+    return count_tokens
+
+
+_token_counters = {}
+
+
+def load_token_counter(model_name):
+    """
+    Contador de tokens con el tokenizer de un modelo de Hugging Face (requiere el
+    paquete tokenizers). Se carga una sola vez por proceso.
+    """
+    if model_name not in _token_counters:
+        from tokenizers import Tokenizer
+        tokenizer = Tokenizer.from_pretrained(model_name)
+        _token_counters[model_name] = make_token_counter(
+            lambda text: tokenizer.encode(text, add_special_tokens=False).ids
+        )
+    return _token_counters[model_name]
+
+
+def iter_sentence_spans(text):
+    """
+    Genera los (inicio, fin) de cada oración, separando por puntuación fuerte.
+    """
+    first = _NON_SPACE.search(text)
+    if not first:
+        return
+    start = first.start()
+    end = len(text.rstrip())
+    for boundary in _SENTENCE_BOUNDARY.finditer(text, start, end):
+        yield start, boundary.start() + 1
+        start = boundary.end()
+    yield start, end
+
+
+def iter_fragment_spans(text, max_size=340, min_size=80, counter=count_words, overlap=0):
+    """
+    Agrupa oraciones consecutivas en fragmentos de como mucho max_size unidades
+    (palabras por defecto, o tokens con un contador de tokens) y genera los
+    (inicio, fin) de cada fragmento dentro de text, sin copiar el texto.
+
+    - Una oración mayor que max_size forma un fragmento por sí sola.
+    - Si añadir una oración supera max_size pero el fragmento actual aún no llega
+      a min_size, se añade igualmente para no generar fragmentos demasiado cortos.
+    - Con overlap > 0, cada fragmento empieza repitiendo las últimas overlap
+      oraciones del anterior (siempre que quepan en max_size).
+    """
+    fragment_start = None
+    fragment_end = None
+    size = 0
+    recent = deque(maxlen=overlap) if overlap else None
+
+    for start, end in iter_sentence_spans(text):
+        sentence_size = counter(text, start, end)
+
+        # Si la oración sola es mayor que el máximo, se añade como fragmento aparte
+        if sentence_size > max_size:
+            if fragment_start is not None:
+                yield fragment_start, fragment_end
+                fragment_start = None
+                size = 0
+                if recent is not None:
+                    recent.clear()
+            yield start, end
+            continue
+
+        if fragment_start is None or size + sentence_size <= max_size or size < min_size:
+            if fragment_start is None:
+                fragment_start = start
+            fragment_end = end
+            size += sentence_size
+        else:
+            # El fragmento actual tiene suficiente tamaño: se cierra y empieza uno nuevo
+            yield fragment_start, fragment_end
+            fragment_start = start
+            size = sentence_size
+            if recent:
+                carried = list(recent)
+                while carried and sum(c for _, _, c in carried) + sentence_size > max_size:
+                    carried.pop(0)
+                if carried:
+                    fragment_start = carried[0][0]
+                    size += sum(c for _, _, c in carried)
+            fragment_end = end
+
+        if recent is not None:
+            recent.append((start, end, sentence_size))
+
+    if fragment_start is not None:
+        yield fragment_start, fragment_end
+
+
+def iter_fragments(text, max_size=340, min_size=80, counter=count_words, overlap=0):
+    """
+    Igual que iter_fragment_spans, pero genera el texto de cada fragmento
+    (conservando los espacios y saltos de línea originales).
+    """
+    for start, end in iter_fragment_spans(text, max_size, min_size, counter, overlap):
+        yield text[start:end]
+
+
+def fragment_text(text):
+    """
+    Fragmenta un artículo con la configuración del entorno: tokens del
+    FRAGMENT_TOKENIZER si está definido y palabras (340/80) si no.
+    """
+    if FRAGMENT_TOKENIZER:
+        counter = load_token_counter(FRAGMENT_TOKENIZER)
+        return list(iter_fragments(text, FRAGMENT_MAX_TOKENS, FRAGMENT_MIN_TOKENS, counter, FRAGMENT_OVERLAP))
+    return list(iter_fragments(text, overlap=FRAGMENT_OVERLAP))
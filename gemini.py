@@ -1,13 +1,81 @@
-from google import genai
-from google.genai import types
 import json
+import logging
 import os
-from dotenv import load_dotenv
+import threading
+import time
+import telemetry
+import resources
 
-load_dotenv()
+resources.load_env()
+
+logger = logging.getLogger(__name__)
 
 
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
+# Permite apuntar el cliente a otro servidor (p.ej. un servidor falso local para pruebas)
+GEMINI_BASE_URL = os.environ.get('GEMINI_BASE_URL')
+GEMINI_MODEL = "gemini-2.5-flash-lite"
+
+# Uso de tokens y latencia acumulados por (tipo de llamada, idioma)
+_usage = {}
+_usage_lock = threading.Lock()
+# Tokens de la última llamada de cada hilo (para la caché de generaciones)
+_last_usage = threading.local()
+
+
+def _create_client():
+    # El SDK de Gemini tarda en importarse; solo se carga cuando se usa el cliente
+    from google import genai
+    from google.genai import types
+
+    http_options = types.HttpOptions(base_url=GEMINI_BASE_URL) if GEMINI_BASE_URL else None
+    return genai.Client(api_key=GEMINI_API_KEY, http_options=http_options)
+
+
+resources.register("gemini", _create_client)
+
+
+def get_client():
+    """
+    Devuelve el cliente de Gemini compartido, creándolo en el primer uso.
+    """
+    return resources.get("gemini")
+
+
+def record_usage(kind, language, response, seconds):
+    metadata = getattr(response, "usage_metadata", None)
+    _last_usage.tokens = ((metadata.prompt_token_count or 0) + (metadata.candidates_token_count or 0)) if metadata else 0
+    telemetry.observe("gemini_call_seconds", seconds, kind=kind)
+    if metadata:
+        telemetry.increment("gemini_tokens_total", metadata.prompt_token_count or 0, kind=kind, direction="prompt")
+        telemetry.increment("gemini_tokens_total", metadata.candidates_token_count or 0, kind=kind, direction="output")
+    with _usage_lock:
+        entry = _usage.setdefault((kind, language), {
+            "calls": 0,
+            "prompt_tokens": 0,
+            "output_tokens": 0,
+            "seconds": 0.0,
+        })
+        entry["calls"] += 1
+        entry["seconds"] += seconds
+        if metadata:
+            entry["prompt_tokens"] += metadata.prompt_token_count or 0
+            entry["output_tokens"] += metadata.candidates_token_count or 0
+
+
+def get_usage_stats():
+    """
+    Devuelve el uso acumulado como {"tipo/idioma": {calls, prompt_tokens, output_tokens, seconds}}.
+    """
+    with _usage_lock:
+        return {f"{kind}/{language}": dict(entry) for (kind, language), entry in _usage.items()}
+
+
+def get_last_call_tokens():
+    """
+    Tokens (entrada + salida) de la última llamada a Gemini hecha desde este hilo.
+    """
+    return getattr(_last_usage, "tokens", 0)
 
 
 def limpiar_y_parsear_json(raw_text):
@@ -17,18 +85,18 @@ def limpiar_y_parsear_json(raw_text):
     try:
         data = json.loads(raw_text)
     except json.JSONDecodeError as e:
-        print("Error al parsear JSON:", e)
+        logger.error(f"Error al parsear JSON: {e}")
         return None
 
     return data
 
 
 def most_relevant_articles():
-    client = genai.Client(
-        api_key=GEMINI_API_KEY,
-    )
+    from google.genai import types
+
+    client = get_client()
 
-    model = "gemini-2.5-flash-lite"
+    model = GEMINI_MODEL
     contents = [
         types.Content(
             role="user",
@@ -46,20 +114,19 @@ def most_relevant_articles():
         response_mime_type="text/plain",
     )
 
+    start = time.perf_counter()
     response = client.models.generate_content(
         model=model,
         contents=contents,
         config=generate_content_config,
     )
+    record_usage("select_topics", "español", response, time.perf_counter() - start)
     return limpiar_y_parsear_json(response.text)
 
 
-def generate_article(texts, language="español"):
-    client = genai.Client(
-        api_key=GEMINI_API_KEY,
-    )
+def build_article_contents(texts, language="español"):
+    from google.genai import types
 
-    model = "gemini-2.5-flash-lite"
     contents = [
         types.Content(
             role="user",
@@ -68,38 +135,189 @@ def generate_article(texts, language="español"):
             ],
         ),
     ]
+    return contents
+
+
+def build_article_config(timeout=None):
+    from google.genai import types
 
     generate_content_config = types.GenerateContentConfig(
+        # timeout: plazo máximo de la llamada en segundos (HttpOptions lo espera en milisegundos)
+        http_options=types.HttpOptions(timeout=int(timeout * 1000)) if timeout else None,
         thinking_config = types.ThinkingConfig(
             thinking_budget=0,
         ),
         response_mime_type="application/json",
-        response_schema=genai.types.Schema(
-            type = genai.types.Type.OBJECT,
+        response_schema=types.Schema(
+            type = types.Type.OBJECT,
             required = ["title", "summary", "body", "language", "category"],
             properties = {
-                "title": genai.types.Schema(
-                    type = genai.types.Type.STRING,
+                "title": types.Schema(
+                    type = types.Type.STRING,
                 ),
-                "summary": genai.types.Schema(
-                    type = genai.types.Type.STRING,
+                "summary": types.Schema(
+                    type = types.Type.STRING,
                 ),
-                "body": genai.types.Schema(
-                    type = genai.types.Type.STRING,
+                "body": types.Schema(
+                    type = types.Type.STRING,
                 ),
-                "language": genai.types.Schema(
-                    type = genai.types.Type.STRING,
+                "language": types.Schema(
+                    type = types.Type.STRING,
                 ),
-                "category": genai.types.Schema(
-                    type = genai.types.Type.STRING,
+                "category": types.Schema(
+                    type = types.Type.STRING,
                 ),
             },
         ),
     )
+    return generate_content_config
+
+
+def generate_article(texts, language="español", timeout=None):
+    client = get_client()
 
+    start = time.perf_counter()
     response = client.models.generate_content(
-        model=model,
+        model=GEMINI_MODEL,
+        contents=build_article_contents(texts, language),
+        config=build_article_config(timeout),
+    )
+    record_usage("generate", language, response, time.perf_counter() - start)
+    return response.text
+
+
+def build_translation_contents(article_json, language="inglés"):
+    from google.genai import types
+
+    return [
+        types.Content(
+            role="user",
+            parts=[
+                types.Part.from_text(text=(f'Traduce al {language} el siguiente artículo periodístico en formato JSON. Traduce el título (title), el resumen (summary) y el cuerpo (body) manteniendo el tono, los saltos de línea y el significado, sin añadir ni quitar información. Mantén la categoría (category) sin cambios e indica el idioma de la traducción (language) en código ISO 639-1. Artículo: {article_json}')),
+            ],
+        ),
+    ]
+
+
+# Traduce un artículo ya generado (JSON con title, summary, body, language y category).
+# Es mucho más barato que volver a generarlo a partir de los fragmentos; las
+# traducciones se guardan en generation_cache (ver main.safe_translate_article).
+def translate_article(article_json, language="inglés", timeout=None):
+    client = get_client()
+    contents = build_translation_contents(article_json, language)
+
+    start = time.perf_counter()
+    response = client.models.generate_content(
+        model=GEMINI_MODEL,
         contents=contents,
-        config=generate_content_config,
+        config=build_article_config(timeout),
     )
+    record_usage("translate", language, response, time.perf_counter() - start)
     return response.text
+
+
+# Modo batch: todas las peticiones de generación se escriben en un JSONL y se envían como un único trabajo
+BATCH_TERMINAL_STATES = {
+    "JOB_STATE_SUCCEEDED",
+    "JOB_STATE_PARTIALLY_SUCCEEDED",
+    "JOB_STATE_FAILED",
+    "JOB_STATE_CANCELLED",
+    "JOB_STATE_EXPIRED",
+}
+
+
+def write_batch_requests(path, article_requests):
+    """
+    Escribe las peticiones de generación en formato JSONL para la Batch API.
+
+    Args:
+        path: Ruta del fichero JSONL
+        article_requests: Lista de tuplas (key, texts, language)
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    config = build_article_config().model_dump(mode="json", exclude_none=True, by_alias=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for key, texts, language in article_requests:
+            contents = [c.model_dump(mode="json", exclude_none=True, by_alias=True) for c in build_article_contents(texts, language)]
+            line = {"key": key, "request": {"contents": contents, "generationConfig": config}}
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+
+def submit_batch(path):
+    """
+    Sube el fichero JSONL y crea el trabajo batch. Devuelve el nombre del trabajo.
+    """
+    from google.genai import types
+
+    client = get_client()
+    uploaded = client.files.upload(
+        file=path,
+        config=types.UploadFileConfig(display_name=os.path.basename(path), mime_type="jsonl"),
+    )
+    job = client.batches.create(
+        model=GEMINI_MODEL,
+        src=uploaded.name,
+        config=types.CreateBatchJobConfig(display_name=os.path.basename(path)),
+    )
+    logger.info(f"Trabajo batch de Gemini creado: {job.name}")
+    return job.name
+
+
+def wait_for_batch(job_name, poll_interval=30, timeout=24 * 3600):
+    """
+    Consulta el estado del trabajo hasta que termina. Lanza TimeoutError si se supera timeout.
+    """
+    client = get_client()
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.batches.get(name=job_name)
+        state = job.state.name if hasattr(job.state, "name") else str(job.state)
+        if state in BATCH_TERMINAL_STATES:
+            logger.info(f"Trabajo batch {job_name} terminado con estado {state}.")
+            return job
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"El trabajo batch {job_name} no terminó a tiempo (estado {state}).")
+        time.sleep(poll_interval)
+
+
+def read_batch_results(job):
+    """
+    Descarga los resultados de un trabajo batch terminado.
+
+    Returns:
+        Diccionario {key: texto de la respuesta o None si esa petición falló}
+    """
+    results = {}
+    if not job.dest or not job.dest.file_name:
+        return results
+    content = get_client().files.download(file=job.dest.file_name)
+    for line in content.decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        key = item.get("key")
+        try:
+            parts = item["response"]["candidates"][0]["content"]["parts"]
+            results[key] = "".join(part.get("text", "") for part in parts)
+        except (KeyError, IndexError, TypeError):
+            logger.warning(f"Petición batch '{key}' sin respuesta válida: {item.get('error')}")
+            results[key] = None
+    return results
+
+
+def generate_articles_batch(article_requests, path, poll_interval=30):
+    """
+    Genera todos los artículos con un único trabajo de la Batch API.
+
+    Args:
+        article_requests: Lista de tuplas (key, texts, language)
+        path: Ruta del fichero JSONL de peticiones
+
+    Returns:
+        Diccionario {key: texto de la respuesta o None}
+    """
+    write_batch_requests(path, article_requests)
+    job = wait_for_batch(submit_batch(path), poll_interval=poll_interval)
+    return read_batch_results(job)
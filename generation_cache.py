@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import gemini
+import qdrant
+import telemetry
+import resources
+
+resources.load_env()
+
+GENERATION_CACHE_ENABLED = os.environ.get('GENERATION_CACHE_ENABLED', '1') == '1'
+GENERATION_CACHE_PATH = os.environ.get('GENERATION_CACHE_PATH', '.cache/generation_cache.sqlite3')
+# Tiempo máximo (segundos) que se reutiliza un artículo generado
+GENERATION_CACHE_TTL = float(os.environ.get('GENERATION_CACHE_TTL', 24 * 3600))
+
+_lock = threading.Lock()
+_conn = None
+_template_hash = None
+_translation_template_hash = None
+
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "tokens_saved": 0,
+    "seconds_saved": 0.0,
+}
+
+
+def _connect():
+    global _conn
+    if _conn is None:
+        directory = os.path.dirname(GENERATION_CACHE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _conn = sqlite3.connect(GENERATION_CACHE_PATH, check_same_thread=False)
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS generations (
+                key TEXT PRIMARY KEY,
+                response TEXT,
+                tokens INTEGER,
+                cost_seconds REAL,
+                created_at REAL
+            )
+        """)
+        _conn.execute("DELETE FROM generations WHERE created_at < ?", (time.time() - GENERATION_CACHE_TTL,))
+        _conn.commit()
+    return _conn
+
+
+def _get_template_hash():
+    """
+    Hash de la plantilla del prompt de generación (con marcadores en lugar de los
+    fragmentos y el idioma), para invalidar la caché cuando cambia el prompt.
+    """
+    global _template_hash
+    if _template_hash is None:
+        template = gemini.build_article_contents("{texts}", "{language}")[0].parts[0].text
+        _template_hash = hashlib.sha256(template.encode("utf-8")).hexdigest()
+    return _template_hash
+
+
+def _get_translation_template_hash():
+    global _translation_template_hash
+    if _translation_template_hash is None:
+        template = gemini.build_translation_contents("{article_json}", "{language}")[0].parts[0].text
+        _translation_template_hash = hashlib.sha256(template.encode("utf-8")).hexdigest()
+    return _translation_template_hash
+
+
+def make_key(texts, language, model):
+    """
+    Clave de una generación: hash de la plantilla, el idioma, el modelo y los ids
+    ordenados de los fragmentos (el orden de recuperación no cambia el artículo).
+    """
+    fragment_ids = sorted(qdrant.get_id(text) for text in texts)
+    fingerprint = json.dumps([_get_template_hash(), language, model, fragment_ids])
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+
+
+def make_translation_key(article_json, language, model):
+    """
+    Clave de una traducción: hash de la plantilla, el idioma, el modelo y el JSON del artículo original.
+    """
+    fingerprint = json.dumps(["translate", _get_translation_template_hash(), language, model, article_json])
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+
+
+def get(key):
+    """
+    Devuelve la respuesta guardada para key, o None si no existe o ha caducado.
+    """
+    if not GENERATION_CACHE_ENABLED:
+        return None
+    with _lock:
+        row = _connect().execute(
+            "SELECT response, tokens, cost_seconds, created_at FROM generations WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or time.time() - row[3] > GENERATION_CACHE_TTL:
+            _stats["misses"] += 1
+            telemetry.increment("cache_requests_total", cache="generation", result="miss")
+            return None
+        response, tokens, cost_seconds, _ = row
+        _stats["hits"] += 1
+        _stats["tokens_saved"] += tokens
+        _stats["seconds_saved"] += cost_seconds
+    telemetry.increment("cache_requests_total", cache="generation", result="hit")
+    return response
+
+
+def put(key, response, tokens, cost_seconds):
+    if not GENERATION_CACHE_ENABLED:
+        return
+    with _lock:
+        conn = _connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO generations (key, response, tokens, cost_seconds, created_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, response, tokens, cost_seconds, time.time())
+        )
+        conn.commit()
+
+
+def get_stats():
+    with _lock:
+        return dict(_stats)
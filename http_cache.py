@@ -0,0 +1,181 @@
+import os
+import sqlite3
+import threading
+import time
+import telemetry
+import resources
+
+resources.load_env()
+
+HTTP_CACHE_ENABLED = os.environ.get('HTTP_CACHE_ENABLED', '1') == '1'
+HTTP_CACHE_PATH = os.environ.get('HTTP_CACHE_PATH', '.cache/http_cache.sqlite3')
+# Tiempo máximo (segundos) que se conserva una entrada desde su última descarga completa
+HTTP_CACHE_TTL = float(os.environ.get('HTTP_CACHE_TTL', 3 * 24 * 3600))
+# Tamaño máximo (bytes) de los cuerpos guardados; se eliminan primero las menos usadas
+HTTP_CACHE_MAX_BYTES = int(os.environ.get('HTTP_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+# Durante este tiempo (segundos) tras validar una entrada se sirve sin petición condicional
+HTTP_CACHE_FRESH_SECONDS = float(os.environ.get('HTTP_CACHE_FRESH_SECONDS', 3600))
+
+_EVICT_EVERY = 50
+
+_lock = threading.Lock()
+_conn = None
+_puts_since_evict = 0
+
+_stats = {
+    "hits": 0,              # servidas sin petición (entrada reciente)
+    "not_modified": 0,      # petición condicional respondida con 304
+    "misses": 0,            # descarga y parseo completos
+    "bytes_saved": 0,
+    "seconds_saved": 0.0,
+}
+
+
+def _connect():
+    global _conn
+    if _conn is None:
+        directory = os.path.dirname(HTTP_CACHE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _conn = sqlite3.connect(HTTP_CACHE_PATH, check_same_thread=False)
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                body BLOB,
+                etag TEXT,
+                last_modified TEXT,
+                text TEXT,
+                extractor TEXT,
+                size INTEGER,
+                cost_seconds REAL,
+                fetched_at REAL,
+                validated_at REAL
+            )
+        """)
+        _conn.commit()
+        _evict()
+    return _conn
+
+
+def _evict():
+    now = time.time()
+    _conn.execute("DELETE FROM entries WHERE fetched_at < ?", (now - HTTP_CACHE_TTL,))
+    total = _conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+    if total > HTTP_CACHE_MAX_BYTES:
+        rows = _conn.execute("SELECT url, size FROM entries ORDER BY validated_at ASC").fetchall()
+        to_delete = []
+        for url, size in rows:
+            if total <= HTTP_CACHE_MAX_BYTES:
+                break
+            to_delete.append((url,))
+            total -= size
+        _conn.executemany("DELETE FROM entries WHERE url = ?", to_delete)
+    _conn.commit()
+
+
+def get(url):
+    """
+    Devuelve la entrada guardada para url como diccionario, o None si no existe.
+    """
+    if not HTTP_CACHE_ENABLED:
+        return None
+    with _lock:
+        row = _connect().execute(
+            "SELECT body, etag, last_modified, text, extractor, cost_seconds, fetched_at, validated_at "
+            "FROM entries WHERE url = ?", (url,)
+        ).fetchone()
+    if row is None:
+        return None
+    body, etag, last_modified, text, extractor, cost_seconds, fetched_at, validated_at = row
+    if time.time() - fetched_at > HTTP_CACHE_TTL:
+        return None
+    return {
+        "body": body,
+        "etag": etag,
+        "last_modified": last_modified,
+        "text": text,
+        "extractor": extractor,
+        "cost_seconds": cost_seconds,
+        "fetched_at": fetched_at,
+        "validated_at": validated_at,
+    }
+
+
+def is_fresh(entry):
+    return time.time() - entry["validated_at"] < HTTP_CACHE_FRESH_SECONDS
+
+
+def conditional_headers(entry):
+    """
+    Cabeceras If-None-Match/If-Modified-Since para revalidar una entrada.
+    """
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def put(url, body, etag, last_modified, text, extractor, cost_seconds):
+    global _puts_since_evict
+    if not HTTP_CACHE_ENABLED:
+        return
+    now = time.time()
+    with _lock:
+        conn = _connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries "
+            "(url, body, etag, last_modified, text, extractor, size, cost_seconds, fetched_at, validated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (url, body, etag, last_modified, text, extractor, len(body), cost_seconds, now, now)
+        )
+        conn.commit()
+        _puts_since_evict += 1
+        if _puts_since_evict >= _EVICT_EVERY:
+            _puts_since_evict = 0
+            _evict()
+
+
+def update_text(url, text, extractor):
+    with _lock:
+        conn = _connect()
+        conn.execute("UPDATE entries SET text = ?, extractor = ? WHERE url = ?", (text, extractor, url))
+        conn.commit()
+
+
+def touch(url):
+    """
+    Marca una entrada como validada ahora (tras un 304).
+    """
+    with _lock:
+        conn = _connect()
+        conn.execute("UPDATE entries SET validated_at = ? WHERE url = ?", (time.time(), url))
+        conn.commit()
+
+
+def record_hit(entry):
+    telemetry.increment("cache_requests_total", cache="http", result="hit")
+    with _lock:
+        _stats["hits"] += 1
+        _stats["bytes_saved"] += len(entry["body"])
+        _stats["seconds_saved"] += entry["cost_seconds"]
+
+
+def record_not_modified(entry, elapsed):
+    telemetry.increment("cache_requests_total", cache="http", result="not_modified")
+    with _lock:
+        _stats["not_modified"] += 1
+        _stats["bytes_saved"] += len(entry["body"])
+        _stats["seconds_saved"] += max(entry["cost_seconds"] - elapsed, 0.0)
+
+
+def record_miss():
+    telemetry.increment("cache_requests_total", cache="http", result="miss")
+    with _lock:
+        _stats["misses"] += 1
+
+
+def get_stats():
+    with _lock:
+        return dict(_stats)
@@ -0,0 +1,126 @@
+import os
+import time
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import telemetry
+import resources
+
+resources.load_env()
+
+# Tiempos de espera (segundos) para conectar y para leer la respuesta
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 5))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 30))
+
+# Reintentos con espera exponencial ante 429 y errores 5xx
+HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', 3))
+HTTP_BACKOFF_FACTOR = float(os.environ.get('HTTP_BACKOFF_FACTOR', 0.5))
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Conexiones abiertas que se mantienen por host
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', 10))
+# Hosts cuyo pool se conserva a la vez (periódicos, Hugging Face...); con menos, al
+# alternar entre hosts urllib3 cierra el pool de uno para abrir el del otro
+HTTP_POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', 20))
+
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+
+class TimeoutSession(requests.Session):
+    """
+    Session que aplica un timeout por defecto a todas las peticiones
+    para que un socket colgado no bloquee toda la ejecución.
+
+    Cada petición se registra en telemetry por host: latencia (incluidos los
+    reintentos de urllib3), bytes recibidos, reintentos, códigos de estado y errores.
+    """
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        host = urlparse(url).netloc
+        start = time.perf_counter()
+        try:
+            response = super().request(method, url, **kwargs)
+        except requests.RequestException:
+            telemetry.increment("http_errors_total", host=host)
+            raise
+        finally:
+            telemetry.observe("http_request_seconds", time.perf_counter() - start, host=host, method=method)
+
+        telemetry.increment("http_requests_total", host=host, status=response.status_code)
+        if not kwargs.get("stream"):
+            telemetry.increment("http_response_bytes", len(response.content), host=host)
+        retries = getattr(getattr(response.raw, "retries", None), "history", None)
+        if retries:
+            telemetry.increment("http_retries_total", len(retries), host=host)
+        return response
+
+
+def _build_adapter(pool_maxsize, pool_connections=1):
+    retry = Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=None,  # también POST/PUT: embeddings y upserts son idempotentes
+        respect_retry_after_header=True,
+        raise_on_status=False,  # devuelve la última respuesta para que raise_for_status lance el error
+    )
+    return HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+
+
+# Pools propios por host ({prefijo de url: pool_maxsize}), registrados con configure_host
+_host_pools = {}
+
+
+def _build_session():
+    session = TimeoutSession(timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+    adapter = _build_adapter(HTTP_POOL_MAXSIZE, HTTP_POOL_CONNECTIONS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    for prefix, pool_maxsize in _host_pools.items():
+        session.mount(prefix, _build_adapter(pool_maxsize))
+    return session
+
+
+resources.register("http_session", _build_session)
+
+
+def get_session():
+    """
+    Devuelve la sesión HTTP compartida (keep-alive) por scraper, embeddings y qdrant.
+    """
+    return resources.get("http_session")
+
+
+def configure_host(url, pool_maxsize):
+    """
+    Reserva un pool de conexiones propio de tamaño pool_maxsize para el host de url.
+    Solo lo registra y se monta al crear la sesión, para que importar un módulo no la
+    cree: hay que llamarlo al importar el módulo, antes del primer get_session().
+    """
+    if not url:
+        return
+    parsed = urlparse(url)
+    _host_pools[f"{parsed.scheme}://{parsed.netloc}/"] = pool_maxsize
+
+
+def get(url, **kwargs):
+    return get_session().get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    return get_session().post(url, **kwargs)
+
+
+def put(url, **kwargs):
+    return get_session().put(url, **kwargs)
@@ -0,0 +1,69 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import resources
+
+resources.load_env()
+
+# Exportación ONNX (opcionalmente cuantizada) del mismo modelo instruct que usa la API
+EMBEDDING_LOCAL_MODEL_PATH = os.environ.get('EMBEDDING_LOCAL_MODEL_PATH', 'models/multilingual-e5-large-instruct/model_quantized.onnx')
+EMBEDDING_LOCAL_TOKENIZER = os.environ.get('EMBEDDING_LOCAL_TOKENIZER', 'intfloat/multilingual-e5-large-instruct')
+EMBEDDING_LOCAL_WORKERS = int(os.environ.get('EMBEDDING_LOCAL_WORKERS', os.cpu_count() or 1))
+EMBEDDING_LOCAL_BATCH_SIZE = int(os.environ.get('EMBEDDING_LOCAL_BATCH_SIZE', 16))
+EMBEDDING_LOCAL_MAX_LENGTH = int(os.environ.get('EMBEDDING_LOCAL_MAX_LENGTH', 512))
+
+
+class LocalEmbeddingBackend:
+    """
+    Calcula embeddings en la CPU con onnxruntime, sin depender del endpoint de Hugging Face.
+
+    Cada lote se divide en sublotes que se ejecutan en paralelo en un pool de hilos
+    (onnxruntime libera el GIL). Igual que la API con normalize_embeddings, el
+    resultado es la media de los estados ocultos según la máscara de atención,
+    normalizada a norma 1.
+    """
+
+    name = "local"
+
+    def __init__(self, model_path=EMBEDDING_LOCAL_MODEL_PATH, tokenizer_name=EMBEDDING_LOCAL_TOKENIZER,
+                 workers=EMBEDDING_LOCAL_WORKERS, batch_size=EMBEDDING_LOCAL_BATCH_SIZE,
+                 max_length=EMBEDDING_LOCAL_MAX_LENGTH):
+        # Dependencias opcionales: solo se necesitan con EMBEDDING_BACKEND=local
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        options = onnxruntime.SessionOptions()
+        # El paralelismo se consigue con el pool de hilos; cada ejecución usa un hilo
+        options.intra_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_pretrained(tokenizer_name) if not os.path.exists(tokenizer_name) \
+            else Tokenizer.from_file(tokenizer_name)
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding()
+
+        self.batch_size = batch_size
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.version = f"local:{os.path.basename(model_path)}"
+
+    def _embed_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            inputs["token_type_ids"] = np.zeros_like(input_ids)
+
+        hidden = self.session.run(None, inputs)[0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.tolist()
+
+    def embed(self, texts):
+        chunks = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        vectors = []
+        for chunk_vectors in self.executor.map(self._embed_batch, chunks):
+            vectors.extend(chunk_vectors)
+        return vectors
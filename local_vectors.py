@@ -0,0 +1,266 @@
+import atexit
+import json
+import os
+import threading
+import numpy as np
+import resources
+
+resources.load_env()
+
+LOCAL_VECTORS_DIR = os.environ.get('LOCAL_VECTORS_DIR', '.cache/vectors')
+# Índice HNSW (requiere hnswlib) para colecciones grandes; por debajo de este tamaño
+# la búsqueda exacta con un producto matricial es más rápida
+LOCAL_VECTORS_HNSW = os.environ.get('LOCAL_VECTORS_HNSW', '0') == '1'
+LOCAL_VECTORS_HNSW_MIN_POINTS = int(os.environ.get('LOCAL_VECTORS_HNSW_MIN_POINTS', 20000))
+
+
+def _matches(value, condition):
+    """
+    Evalúa una condición de filtro de Qdrant (match value/any o range) sobre un valor
+    del payload. Si el valor es una lista basta con que cumpla uno de sus elementos.
+    """
+    if isinstance(value, list):
+        return any(_matches(item, condition) for item in value)
+    if value is None:
+        return False
+    if "match" in condition:
+        match = condition["match"]
+        if "value" in match:
+            return value == match["value"]
+        if "any" in match:
+            return value in match["any"]
+        if "except" in match:
+            return value not in match["except"]
+        return False
+    if "range" in condition:
+        bounds = condition["range"]
+        try:
+            if "gt" in bounds and bounds["gt"] is not None and not value > bounds["gt"]:
+                return False
+            if "gte" in bounds and bounds["gte"] is not None and not value >= bounds["gte"]:
+                return False
+            if "lt" in bounds and bounds["lt"] is not None and not value < bounds["lt"]:
+                return False
+            if "lte" in bounds and bounds["lte"] is not None and not value <= bounds["lte"]:
+                return False
+        except TypeError:
+            return False
+        return True
+    raise ValueError(f"Condición de filtro no soportada: {condition}")
+
+
+def payload_matches(payload, query_filter):
+    """
+    Evalúa un filtro con la sintaxis de Qdrant (must / should / must_not) sobre un payload.
+    """
+    if not query_filter:
+        return True
+
+    def check(condition):
+        if any(key in condition for key in ("must", "should", "must_not")):
+            return payload_matches(payload, condition)
+        return _matches(payload.get(condition["key"]), condition)
+
+    if not all(check(c) for c in query_filter.get("must") or []):
+        return False
+    should = query_filter.get("should") or []
+    if should and not any(check(c) for c in should):
+        return False
+    if any(check(c) for c in query_filter.get("must_not") or []):
+        return False
+    return True
+
+
+class LocalVectorStore:
+    """
+    Almacén de vectores en el propio proceso, alternativa a la colección de Qdrant.
+
+    Los vectores se guardan en una matriz float32 (vectors.f32) que se abre mapeada en
+    memoria (copia en escritura) y los ids y payloads en points.json. La búsqueda es un
+    producto escalar vectorizado con top-k, o un índice HNSW si se activa con
+    LOCAL_VECTORS_HNSW y la colección es grande.
+    """
+
+    def __init__(self, directory=LOCAL_VECTORS_DIR, use_hnsw=LOCAL_VECTORS_HNSW):
+        self.directory = directory
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.points_path = os.path.join(directory, "points.json")
+        self.use_hnsw = use_hnsw
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._hnsw = None
+        self._load()
+
+    def _load(self):
+        self.ids = []
+        self.payloads = []
+        self.vectors = None
+        if os.path.exists(self.points_path):
+            with open(self.points_path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.ids = data["ids"]
+            self.payloads = data["payloads"]
+            if self.ids:
+                self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="c",
+                                         shape=(len(self.ids), data["dim"]))
+        self.index = {id: row for row, id in enumerate(self.ids)}
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            dim = self.vectors.shape[1] if self.vectors is not None else 0
+            if self.vectors is not None:
+                tmp_path = self.vectors_path + ".tmp"
+                np.asarray(self.vectors, dtype=np.float32).tofile(tmp_path)
+                os.replace(tmp_path, self.vectors_path)
+            tmp_path = self.points_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"dim": dim, "ids": self.ids, "payloads": self.payloads}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.points_path)
+            self._dirty = False
+
+    def _changed(self):
+        self._dirty = True
+        self._hnsw = None
+
+    def upsert(self, points):
+        """
+        Inserta o reemplaza puntos con el formato de Qdrant ({"id", "vector", "payload"}).
+        """
+        with self._lock:
+            new_vectors = []
+            for point in points:
+                vector = np.asarray(point["vector"], dtype=np.float32)
+                row = self.index.get(point["id"])
+                if row is not None:
+                    self.vectors[row] = vector
+                    self.payloads[row] = point["payload"]
+                else:
+                    self.index[point["id"]] = len(self.ids)
+                    new_vectors.append(vector)
+                    self.ids.append(point["id"])
+                    self.payloads.append(point["payload"])
+            if new_vectors:
+                stacked = np.stack(new_vectors)
+                self.vectors = stacked if self.vectors is None else np.concatenate([self.vectors, stacked])
+            self._changed()
+
+    def _keep_rows(self, keep):
+        self.ids = [id for id, k in zip(self.ids, keep) if k]
+        self.payloads = [p for p, k in zip(self.payloads, keep) if k]
+        self.vectors = self.vectors[np.asarray(keep, dtype=bool)] if self.ids else None
+        self.index = {id: row for row, id in enumerate(self.ids)}
+        self._changed()
+
+    def delete(self, query_filter=None):
+        """
+        Elimina los puntos que cumplen el filtro (todos si no hay filtro). Devuelve cuántos.
+        """
+        with self._lock:
+            keep = [not payload_matches(p, query_filter) for p in self.payloads]
+            deleted = len(keep) - sum(keep)
+            if deleted:
+                self._keep_rows(keep)
+            return deleted
+
+    def count(self, query_filter=None):
+        with self._lock:
+            return sum(1 for p in self.payloads if payload_matches(p, query_filter))
+
+    def urls_with_points(self, urls, query_filter=None):
+        """
+        Subconjunto de urls que aparece en el campo "urls" de algún punto que cumple el filtro.
+        """
+        with self._lock:
+            return {
+                url for p in self.payloads if payload_matches(p, query_filter)
+                for url in p.get("urls") or [p.get("url")] if url in urls
+            }
+
+    def get_ids(self, query_filter=None):
+        with self._lock:
+            if not query_filter:
+                return set(self.ids)
+            return {id for id, p in zip(self.ids, self.payloads) if payload_matches(p, query_filter)}
+
+    def set_payload(self, ids, payload, query_filter=None):
+        """
+        Actualiza el payload de los puntos con esos ids o, si ids es None, de los que cumplen el filtro.
+        """
+        with self._lock:
+            if ids is None:
+                rows = [row for row, p in enumerate(self.payloads) if payload_matches(p, query_filter)]
+            else:
+                rows = [self.index[id] for id in ids if id in self.index]
+            for row in rows:
+                self.payloads[row].update(payload)
+            self._dirty = True
+            return len(rows)
+
+    def _get_hnsw(self):
+        if self._hnsw is None:
+            import hnswlib
+            index = hnswlib.Index(space="ip", dim=self.vectors.shape[1])
+            index.init_index(max_elements=len(self.ids), ef_construction=200, M=16)
+            index.add_items(np.asarray(self.vectors), np.arange(len(self.ids)))
+            index.set_ef(128)
+            self._hnsw = index
+        return self._hnsw
+
+    def search(self, vector, limit=9, query_filter=None, with_vector=False):
+        """
+        Devuelve {"points": [...]} con los limit puntos de mayor producto escalar,
+        con el mismo formato que /points/query de Qdrant.
+        """
+        with self._lock:
+            if not self.ids:
+                return {"points": []}
+            query = np.asarray(vector, dtype=np.float32)
+            mask = None
+            if query_filter:
+                mask = np.fromiter((payload_matches(p, query_filter) for p in self.payloads), dtype=bool, count=len(self.ids))
+                if not mask.any():
+                    return {"points": []}
+
+            if self.use_hnsw and len(self.ids) >= LOCAL_VECTORS_HNSW_MIN_POINTS:
+                k = min(limit, int(mask.sum()) if mask is not None else len(self.ids))
+                labels, distances = self._get_hnsw().knn_query(
+                    query, k=k, filter=(lambda label: bool(mask[label])) if mask is not None else None
+                )
+                # En el espacio "ip" hnswlib devuelve 1 - producto escalar
+                rows = labels[0]
+                scores = 1.0 - distances[0]
+            else:
+                all_scores = np.asarray(self.vectors) @ query
+                if mask is not None:
+                    all_scores = np.where(mask, all_scores, -np.inf)
+                k = min(limit, len(self.ids) if mask is None else int(mask.sum()))
+                rows = np.argpartition(-all_scores, k - 1)[:k]
+                rows = rows[np.argsort(-all_scores[rows])]
+                scores = all_scores[rows]
+
+            points = []
+            for row, score in zip(rows, scores):
+                point = {"id": self.ids[row], "score": float(score), "payload": self.payloads[row]}
+                if with_vector:
+                    point["vector"] = self.vectors[row].tolist()
+                points.append(point)
+            return {"points": points}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """
+    Devuelve el almacén local compartido; se guarda en disco al terminar el proceso.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = LocalVectorStore()
+            atexit.register(_store.save)
+        return _store
@@ -0,0 +1,343 @@
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import ratelimit
+import storage
+import telemetry
+import resources
+
+resources.load_env()
+
+logger = logging.getLogger(__name__)
+
+# "mailersend" o "fake" (no envía nada; guarda los correos en memoria, para pruebas)
+MAIL_PROVIDER = os.environ.get('MAIL_PROVIDER', 'mailersend')
+# Correos por petición al endpoint bulk-email (0 desactiva el envío en bloque)
+MAIL_BULK_SIZE = int(os.environ.get('MAIL_BULK_SIZE', 500))
+# Envíos individuales: hilos, ritmo máximo (peticiones por segundo) e intentos por correo
+MAIL_WORKERS = int(os.environ.get('MAIL_WORKERS', 4))
+MAIL_REQUESTS_PER_SECOND = float(os.environ.get('MAIL_REQUESTS_PER_SECOND', 2))
+MAIL_MAX_ATTEMPTS = int(os.environ.get('MAIL_MAX_ATTEMPTS', 3))
+# Consulta del estado de los envíos en bloque: intervalo y espera máxima (segundos); los
+# que no terminan en ese tiempo quedan "queued" y se resuelven en la siguiente ejecución
+MAIL_BULK_POLL_INTERVAL = float(os.environ.get('MAIL_BULK_POLL_INTERVAL', 5))
+MAIL_BULK_TIMEOUT = float(os.environ.get('MAIL_BULK_TIMEOUT', 120))
+
+# Estados finales de un envío en bloque
+BULK_DONE_STATES = {"completed", "failed"}
+
+
+class MailerSendProvider:
+    """
+    Envío a través del SDK de MailerSend.
+    """
+
+    name = "mailersend"
+
+    def __init__(self, client):
+        self.client = client
+
+    def send(self, email):
+        self.client.emails.send(email)
+
+    def send_bulk(self, emails):
+        """
+        Encola los correos con una sola petición y devuelve el id del envío en bloque.
+        """
+        response = self.client.emails.send_bulk(emails)
+        data = getattr(response, "data", None) or {}
+        return data.get("bulk_email_id")
+
+    def get_bulk_status(self, bulk_email_id):
+        """
+        Devuelve {"state", "failed"}, donde failed es {posición del correo en el envío: error}
+        para los correos rechazados por validación o por destinatarios suprimidos
+        (claves "message.<posición>" de la respuesta).
+        """
+        response = self.client.emails.get_bulk_status(bulk_email_id)
+        data = getattr(response, "data", None) or {}
+        data = data.get("data", data)
+        failed = {}
+        for field in ("validation_errors", "suppressed_recipients"):
+            for key, error in (data.get(field) or {}).items():
+                match = re.match(r"message\.(\d+)", key)
+                if match:
+                    failed[int(match.group(1))] = f"{field}: {error}"
+        return {"state": data.get("state"), "failed": failed}
+
+
+class FakeMailProvider:
+    """
+    Proveedor local que no envía correos: los guarda en sent. Las direcciones de
+    fail_addresses fallan siempre, para probar los reintentos y el registro de entregas.
+
+    Como en MailerSend, un envío en bloque solo se acepta: sus correos se procesan
+    tras bulk_polls consultas de get_bulk_status, que devuelve como fallidos los de
+    fail_addresses. Con fail_bulk el envío en bloque entero termina en "failed".
+    """
+
+    name = "fake"
+
+    def __init__(self, fail_addresses=(), supports_bulk=True, bulk_polls=0, fail_bulk=False):
+        self.sent = []
+        self.bulk_requests = 0
+        self.fail_addresses = set(fail_addresses)
+        self.supports_bulk = supports_bulk
+        self.bulk_polls = bulk_polls
+        self.fail_bulk = fail_bulk
+        self.bulks = {}  # id -> {"emails", "polls", "status"}
+        self._lock = threading.Lock()
+
+    def _error(self, email):
+        for recipient in email.to:
+            if recipient.email in self.fail_addresses:
+                return f"Fallo simulado para {recipient.email}"
+        return None
+
+    def send(self, email):
+        error = self._error(email)
+        if error:
+            raise RuntimeError(error)
+        with self._lock:
+            self.sent.append(email)
+
+    def send_bulk(self, emails):
+        if not self.supports_bulk:
+            raise RuntimeError("Envío en bloque no disponible")
+        with self._lock:
+            self.bulk_requests += 1
+            bulk_id = f"fake-bulk-{self.bulk_requests}"
+            self.bulks[bulk_id] = {"emails": list(emails), "polls": 0, "status": None}
+        return bulk_id
+
+    def get_bulk_status(self, bulk_email_id):
+        with self._lock:
+            bulk = self.bulks[bulk_email_id]
+            bulk["polls"] += 1
+            if bulk["status"] is None and bulk["polls"] > self.bulk_polls:
+                if self.fail_bulk:
+                    bulk["status"] = {"state": "failed", "failed": {}}
+                else:
+                    failed = {}
+                    for index, email in enumerate(bulk["emails"]):
+                        error = self._error(email)
+                        if error:
+                            failed[index] = error
+                        else:
+                            self.sent.append(email)
+                    bulk["status"] = {"state": "completed", "failed": failed}
+            return bulk["status"] or {"state": "processing", "failed": {}}
+
+
+def get_provider(client_factory):
+    """
+    Devuelve el proveedor configurado en MAIL_PROVIDER; client_factory crea el
+    cliente de MailerSend solo si hace falta.
+    """
+    if MAIL_PROVIDER == "fake":
+        return FakeMailProvider()
+    return MailerSendProvider(client_factory())
+
+
+class DeliveryLog:
+    """
+    Registro de entregas en MongoDB con un documento por (usuario, día).
+
+    El índice único sobre (user_id, date) hace que marcar un envío sea idempotente:
+    un reintento o una segunda ejecución del mismo día no vuelve a enviar el correo
+    a los usuarios con estado "sent" ni a los "queued" (aceptados en un envío en
+    bloque que aún no ha terminado).
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.collection.create_index([("user_id", 1), ("date", 1)], unique=True)
+
+    @staticmethod
+    def today():
+        return datetime.now(timezone.utc).date().isoformat()
+
+    def sent_user_ids(self, date):
+        return {doc["user_id"] for doc in self.collection.find({"date": date, "status": "sent"}, {"user_id": 1})}
+
+    def queued(self, date):
+        """
+        Devuelve {bulk_email_id: {posición en el envío: user_id}} de los envíos en bloque sin resolver.
+        """
+        bulks = {}
+        for doc in self.collection.find({"date": date, "status": "queued"}, {"user_id": 1, "bulk_email_id": 1, "bulk_index": 1}):
+            bulks.setdefault(doc["bulk_email_id"], {})[doc["bulk_index"]] = doc["user_id"]
+        return bulks
+
+    def mark(self, user_ids, date, status, per_user=None, new_attempt=True, **fields):
+        """
+        Guarda el estado de los usuarios con un único bulk_write desordenado de upserts.
+        per_user (opcional) es {user_id: campos} con los campos propios de cada usuario;
+        new_attempt=False no cuenta un intento más (al resolver un envío en bloque).
+        """
+        from pymongo import UpdateOne
+        from pymongo.errors import BulkWriteError
+
+        now = datetime.now(timezone.utc)
+        updates = []
+        for user_id in user_ids:
+            values = dict(fields, **(per_user or {}).get(user_id, {}), status=status, updated_at=now)
+            update = {"$set": values}
+            if new_attempt:
+                update["$inc"] = {"attempts": 1}
+            if "error" not in values:
+                update["$unset"] = {"error": ""}
+            updates.append(({"user_id": user_id, "date": date}, update))
+        if not updates:
+            return
+
+        if storage.is_mongomock(self.collection):
+            # mongomock no admite las operaciones de bulk_write de las versiones recientes de pymongo
+            for query, update in updates:
+                self.collection.update_one(query, update, upsert=True)
+            return
+        try:
+            self.collection.bulk_write([UpdateOne(q, u, upsert=True) for q, u in updates], ordered=False)
+        except BulkWriteError as e:
+            duplicates = [error["index"] for error in e.details.get("writeErrors", []) if error.get("code") == 11000]
+            if len(duplicates) < len(e.details.get("writeErrors", [])):
+                raise
+            # Dos upserts simultáneos del mismo usuario: el segundo ya encuentra el documento
+            self.collection.bulk_write([UpdateOne(*updates[index]) for index in duplicates], ordered=False)
+
+
+def resolve_bulks(provider, delivery_log, date, bulk_ids=None, timeout=MAIL_BULK_TIMEOUT, poll_interval=MAIL_BULK_POLL_INTERVAL):
+    """
+    Consulta los envíos en bloque "queued" del día (solo bulk_ids, si se pasa) hasta que terminan (o hasta timeout)
+    y marca sus destinatarios como "sent" o "failed" (se reintentan en la siguiente
+    ejecución). Los de un envío en bloque que falla entero pasan a "failed".
+
+    Returns:
+        Diccionario con los user_id enviados ("sent"), fallidos ("failed"), aún en cola
+        ("queued") y, entre los fallidos, los de envíos en bloque fallidos enteros ("bulk_failed")
+    """
+    pending = {
+        bulk_id: users for bulk_id, users in delivery_log.queued(date).items()
+        if bulk_ids is None or bulk_id in bulk_ids
+    }
+    result = {"sent": set(), "failed": set(), "queued": set(), "bulk_failed": set()}
+    deadline = time.monotonic() + timeout
+    while pending:
+        for bulk_id in list(pending):
+            try:
+                status = provider.get_bulk_status(bulk_id)
+            except Exception as e:
+                logger.warning(f"No se pudo consultar el envío en bloque {bulk_id}: {e}")
+                continue
+            if status["state"] not in BULK_DONE_STATES:
+                continue
+            users = pending.pop(bulk_id)
+            if status["state"] == "failed":
+                logger.error(f"El envío en bloque {bulk_id} de {len(users)} correos ha fallado.")
+                failed = {index: f"Envío en bloque {bulk_id} fallido" for index in users}
+                result["bulk_failed"].update(users.values())
+            else:
+                failed = status["failed"]
+            sent = [user_id for index, user_id in users.items() if index not in failed]
+            errors = {users[index]: {"error": str(error)} for index, error in failed.items() if index in users}
+            delivery_log.mark(sent, date, "sent", new_attempt=False)
+            delivery_log.mark(list(errors), date, "failed", per_user=errors, new_attempt=False)
+            result["sent"].update(sent)
+            result["failed"].update(errors)
+        if not pending or time.monotonic() >= deadline:
+            break
+        time.sleep(poll_interval)
+
+    for users in pending.values():
+        result["queued"].update(users.values())
+    if result["queued"]:
+        logger.warning(f"{len(result['queued'])} correos de envíos en bloque siguen en cola; se comprobarán en la siguiente ejecución.")
+    return result
+
+
+def dispatch(messages, provider, delivery_log, date=None):
+    """
+    Envía los correos que aún no constan como enviados (ni en cola) hoy.
+
+    Primero se intenta el envío en bloque (MAIL_BULK_SIZE correos por petición). El
+    proveedor solo acepta el bloque: sus destinatarios quedan "queued" y resolve_bulks
+    consulta su estado para marcarlos "sent" o "failed". Los correos de un bloque que
+    falla, o todos si el proveedor no lo admite, se envían de forma concurrente con
+    MAIL_WORKERS hilos, un límite de MAIL_REQUESTS_PER_SECOND y hasta
+    MAIL_MAX_ATTEMPTS intentos con espera exponencial.
+
+    Args:
+        messages: Lista de tuplas (user_id, dirección, EmailRequest)
+
+    Returns:
+        Diccionario con el número de correos enviados, omitidos, fallidos y aún en cola
+    """
+    date = date or delivery_log.today()
+    # Los envíos en bloque de una ejecución anterior que seguían en cola se consultan una vez
+    earlier = resolve_bulks(provider, delivery_log, date, timeout=0)
+    already_sent = delivery_log.sent_user_ids(date)
+    pending = [m for m in messages if m[0] not in already_sent and m[0] not in earlier["queued"]]
+    stats = {"sent": 0, "skipped": len(messages) - len(pending), "failed": 0, "queued": 0}
+    if not pending:
+        return stats
+
+    individual = []
+    if MAIL_BULK_SIZE > 0:
+        bulk_ids = set()
+        for i in range(0, len(pending), MAIL_BULK_SIZE):
+            chunk = pending[i:i + MAIL_BULK_SIZE]
+            try:
+                with telemetry.timer("mail_request_seconds", provider=provider.name, mode="bulk"):
+                    bulk_id = provider.send_bulk([email for _, _, email in chunk])
+            except Exception as e:
+                logger.warning(f"Error en el envío en bloque de {len(chunk)} correos ({e}); se envían uno a uno.")
+                individual.extend(chunk)
+                continue
+            bulk_ids.add(bulk_id)
+            user_ids = [user_id for user_id, _, _ in chunk]
+            delivery_log.mark(user_ids, date, "queued", bulk_email_id=bulk_id,
+                              per_user={user_id: {"bulk_index": index} for index, user_id in enumerate(user_ids)})
+
+        if bulk_ids:
+            resolved = resolve_bulks(provider, delivery_log, date, bulk_ids)
+            # Los destinatarios de un bloque que ha fallado entero se envían uno a uno
+            retry = [m for m in pending if m[0] in resolved["bulk_failed"]]
+            individual.extend(retry)
+            stats["sent"] += len(resolved["sent"])
+            stats["failed"] += len(resolved["failed"]) - len(retry)
+            stats["queued"] += len(resolved["queued"])
+    else:
+        individual = pending
+
+    limiter = ratelimit.TokenBucket(rate=MAIL_REQUESTS_PER_SECOND, capacity=MAIL_WORKERS)
+
+    def send_one(message):
+        user_id, address, email = message
+        for attempt in range(1, MAIL_MAX_ATTEMPTS + 1):
+            limiter.acquire()
+            try:
+                with telemetry.timer("mail_request_seconds", provider=provider.name, mode="single"):
+                    provider.send(email)
+                delivery_log.mark([user_id], date, "sent")
+                return True
+            except Exception as e:
+                error = str(e)
+                if attempt < MAIL_MAX_ATTEMPTS:
+                    telemetry.increment("mail_retries_total", provider=provider.name)
+                    time.sleep(ratelimit.backoff_delay(attempt))
+        logger.error(f"Error al enviar el correo a {address}: {error}")
+        delivery_log.mark([user_id], date, "failed", error=error)
+        return False
+
+    if individual:
+        with ThreadPoolExecutor(max_workers=MAIL_WORKERS) as executor:
+            for ok in executor.map(send_one, individual):
+                stats["sent" if ok else "failed"] += 1
+
+    for outcome in ("sent", "skipped", "failed", "queued"):
+        telemetry.increment("mail_messages_total", stats[outcome], provider=provider.name, outcome=outcome)
+    return stats
@@ -1,21 +1,60 @@
+import argparse
 import json
-from google.genai import errors
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import checkpoints
+import crawler
+import dedup
+import generation_cache
+import http_cache
 import notifications
 import qdrant
+import ratelimit
+import retrieval
+import storage
+import telemetry
+import url_index
 import gemini
 import datetime
-from pymongo import MongoClient
 import os
-from dotenv import load_dotenv
+import resources
 
 
-load_dotenv()
+resources.load_env()
 
-MONGODB_URI = os.environ.get('MONGODB_URI')
+logger = logging.getLogger(__name__)
 
-client = MongoClient(MONGODB_URI)
-db = client["tfg_db"]
-articles = db["articles"]
+# "incremental" solo inserta fragmentos nuevos y caduca los antiguos; "rebuild" vacía la colección antes
+INGEST_MODE = os.environ.get('INGEST_MODE', 'incremental')
+# Horas que se conservan en Qdrant los fragmentos que dejan de aparecer en las portadas
+QDRANT_RETENTION_HOURS = float(os.environ.get('QDRANT_RETENTION_HOURS', 0))
+# Generación concurrente: hilos, ritmo máximo acorde a la cuota de Gemini y plazo por llamada (segundos)
+GENERATION_WORKERS = int(os.environ.get('GENERATION_WORKERS', 6))
+GEMINI_REQUESTS_PER_MINUTE = float(os.environ.get('GEMINI_REQUESTS_PER_MINUTE', 30))
+GEMINI_CALL_DEADLINE = float(os.environ.get('GEMINI_CALL_DEADLINE', 90))
+
+# Modo batch: las generaciones se envían como un único trabajo de la Batch API de Gemini
+GEMINI_BATCH_MODE = os.environ.get('GEMINI_BATCH_MODE', '0') == '1'
+GEMINI_BATCH_FILE = os.environ.get('GEMINI_BATCH_FILE', '.cache/gemini_batch_requests.jsonl')
+GEMINI_BATCH_POLL_INTERVAL = float(os.environ.get('GEMINI_BATCH_POLL_INTERVAL', 30))
+
+LANGUAGES = ["español", "inglés"]
+# Fragmentos recuperados por query y si la búsqueda se restringe a la categoría de la query
+RETRIEVAL_LIMIT = int(os.environ.get('RETRIEVAL_LIMIT', 9))
+RETRIEVAL_FILTER_BY_CATEGORY = os.environ.get('RETRIEVAL_FILTER_BY_CATEGORY', '0') == '1'
+# Idioma de los fragmentos recuperados y antigüedad máxima en horas (0 = sin límite)
+RETRIEVAL_LANGUAGE = os.environ.get('RETRIEVAL_LANGUAGE', 'es')
+RETRIEVAL_MAX_AGE_HOURS = float(os.environ.get('RETRIEVAL_MAX_AGE_HOURS', 0))
+# "mmr" pide más candidatos y elige fragmentos diversos; "topk" se queda con los más cercanos
+RETRIEVAL_MODE = os.environ.get('RETRIEVAL_MODE', 'mmr')
+# "full" genera cada idioma desde los fragmentos; "translate" genera en español y traduce el resto
+GENERATION_MODE = os.environ.get('GENERATION_MODE', 'full')
+# Reanuda la ejecución del día (o PIPELINE_RUN_ID) saltando las etapas y artículos ya completados
+PIPELINE_RESUME = os.environ.get('PIPELINE_RESUME', '0') == '1'
+PIPELINE_RUN_ID = os.environ.get('PIPELINE_RUN_ID')
+
+gemini_limiter = ratelimit.TokenBucket(rate=GEMINI_REQUESTS_PER_MINUTE / 60, capacity=GENERATION_WORKERS)
 
 def safe_most_relevant_articles(retries=3):
     """
@@ -28,126 +67,597 @@ def safe_most_relevant_articles(retries=3):
             if result:
                 return result
             else:
-                print(f"Respuesta vacía o inválida en most_relevant_articles (intento {attempt}/{retries})")
+                logger.warning(f"Respuesta vacía o inválida en most_relevant_articles (intento {attempt}/{retries})")
         except Exception as e:
-            print(f"Error en most_relevant_articles (intento {attempt}/{retries}): {e}")
+            logger.error(f"Error en most_relevant_articles (intento {attempt}/{retries}): {e}")
 
     # si llegamos aquí, todos los intentos fallaron
     raise RuntimeError("No se ha podido obtener una respuesta válida de most_relevant_articles después de varios intentos.")
 
-def safe_generate_article(texts, language="español", retries=3):
+def call_gemini_with_retries(description, func, *args, retries=3):
     """
-    Llama a gemini.generate_article con reintentos en caso de error de servidor.
+    Llama a func respetando el límite de ritmo de Gemini, con un plazo máximo por
+    llamada y reintentos con espera exponencial y jitter en caso de error de servidor
+    o de plazo agotado.
     """
+    # httpx y los errores del SDK de Gemini se importan aquí para no cargarlos al importar main
+    import httpx
+    from google.genai import errors
+
     for attempt in range(1, retries + 1):
+        gemini_limiter.acquire()
         try:
-            return gemini.generate_article(texts, language)
-        except errors.ServerError as e:
-            print(f"Error en Gemini (intento {attempt}/{retries}): {e}")
+            return func(*args, timeout=GEMINI_CALL_DEADLINE)
+        except (errors.ServerError, httpx.TimeoutException) as e:
+            logger.error(f"Error en Gemini (intento {attempt}/{retries}): {e}")
+            telemetry.increment("gemini_errors_total", kind=description)
+            if attempt < retries:
+                telemetry.increment("gemini_retries_total", kind=description)
+                time.sleep(ratelimit.backoff_delay(attempt))
         except Exception as e:
-            print(f"Error inesperado en generate_article: {e}")
+            logger.error(f"Error inesperado en {description}: {e}")
+            telemetry.increment("gemini_errors_total", kind=description)
             break
     return None
 
-def generate_and_insert_mongodb(category_queries, category_name):
+def is_valid_article_json(response):
+    try:
+        json.loads(response)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+def safe_generate_article(texts, language="español", retries=3):
+    """
+    Llama a gemini.generate_article con límite de ritmo, plazo y reintentos.
+
+    Si ya se generó un artículo con los mismos fragmentos, idioma, modelo y prompt
+    (p.ej. al relanzar el pipeline el mismo día), se devuelve el guardado en
+    generation_cache sin llamar a Gemini.
+    """
+    key = generation_cache.make_key(texts, language, gemini.GEMINI_MODEL)
+    cached = generation_cache.get(key)
+    if cached is not None:
+        return cached
+
+    start = time.perf_counter()
+    response = call_gemini_with_retries("generate_article", gemini.generate_article, texts, language, retries=retries)
+    if response and is_valid_article_json(response):
+        generation_cache.put(key, response, gemini.get_last_call_tokens(), time.perf_counter() - start)
+    return response
+
+def safe_translate_article(article_json, language="inglés", retries=3):
+    """
+    Llama a gemini.translate_article con límite de ritmo, plazo y reintentos.
+
+    Las traducciones se guardan en generation_cache con el artículo original y el
+    idioma como clave, y se consulta antes de esperar al límite de ritmo.
+    """
+    key = generation_cache.make_translation_key(article_json, language, gemini.GEMINI_MODEL)
+    cached = generation_cache.get(key)
+    if cached is not None:
+        return cached
+
+    start = time.perf_counter()
+    response = call_gemini_with_retries("translate_article", gemini.translate_article, article_json, language, retries=retries)
+    if response and is_valid_article_json(response):
+        generation_cache.put(key, response, gemini.get_last_call_tokens(), time.perf_counter() - start)
+    return response
+
+def build_article_payload(generated_article_response, query, qdrant_data, category_name):
+    """
+    Convierte la respuesta de Gemini en el documento que se guarda en MongoDB.
+    Devuelve None si la respuesta no es válida.
+    """
+    if not generated_article_response:
+        logger.error(f"Error al generar el artículo '{query}': No se recibió respuesta válida.")
+        return None
+
+    try:
+        article_payload = json.loads(generated_article_response)
+    except Exception as e:
+        logger.error(f"Error al generar o parsear el artículo '{query}': {e}")
+        return None
+
+    article_payload["urls"] = qdrant_data.get("urls", [])
+    article_payload["category"] = category_name
+    article_payload["created_at"] = datetime.datetime.now(datetime.timezone.utc)
+    return article_payload
+
+def insert_article(writer, article_payload, query, language, on_written=None):
+    """
+    Encola el artículo en el ArticleWriter, que lo escribe con upsert por la clave
+    estable de (día, idioma, query). on_written se llama cuando ya está guardado.
+    """
+    def written(article):
+        telemetry.increment("articles_inserted_total", category=article["category"])
+        logger.info(f"Artículo '{article.get('title')}' ({article['category']}) insertado en MongoDB.")
+        if on_written:
+            on_written(article)
+
+    writer.add(article_payload, storage.content_key(query, language), written)
+
+def retrieve_all(queries_by_category):
     """
-    Procesa artículos de una categoría específica y los inserta en MongoDB
+    Recupera de Qdrant los fragmentos de todas las queries del día con un único
+    embedding por lotes y una única búsqueda batch, filtrando en Qdrant por idioma,
+    antigüedad y, opcionalmente, categoría.
+
+    En modo "mmr" se piden RETRIEVAL_OVERFETCH veces más candidatos (con sus vectores)
+    y retrieval.diversify elige los RETRIEVAL_LIMIT más relevantes y diversos, con un
+    máximo de fragmentos por URL y un presupuesto de tokens para el contexto. En modo
+    "topk" solo se aplica el presupuesto de tokens.
+
+    Returns:
+        Lista de tuplas (categoria, query, qdrant_data)
+    """
+    jobs = [
+        (category_name, query)
+        for category_name, queries in queries_by_category.items()
+        for query in queries
+    ]
+    since = None
+    if RETRIEVAL_MAX_AGE_HOURS:
+        since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=RETRIEVAL_MAX_AGE_HOURS)
+    query_filters = [
+        qdrant.build_filter(
+            category=category_name if RETRIEVAL_FILTER_BY_CATEGORY else None,
+            language=RETRIEVAL_LANGUAGE,
+            since=since
+        )
+        for category_name, _ in jobs
+    ]
+
+    use_mmr = RETRIEVAL_MODE == "mmr"
+    responses = qdrant.search_points_semantically_batch(
+        [query for _, query in jobs],
+        limits=RETRIEVAL_LIMIT * retrieval.RETRIEVAL_OVERFETCH if use_mmr else RETRIEVAL_LIMIT,
+        query_filters=query_filters,
+        with_vector=use_mmr
+    )
+    if use_mmr:
+        responses = retrieval.diversify(responses, RETRIEVAL_LIMIT)
+    else:
+        responses = retrieval.limit_context(responses)
+    return [
+        (category_name, query, qdrant.get_texts_and_urls(response))
+        for (category_name, query), response in zip(jobs, responses)
+    ]
+
+def checkpoint_item(checkpoint, query, language, response, inserted=None):
+    """
+    Callback que, una vez guardado el artículo en MongoDB, lo registra en el
+    checkpoint y añade su (query, idioma) al conjunto inserted.
+    """
+    key = checkpoints.item_key(query, language)
+
+    def on_written(article):
+        if inserted is not None:
+            inserted.add(key)
+        if checkpoint:
+            checkpoint.mark_item("insert", key, response)
+    return on_written
+
+def pending_items(queries_by_category, inserted):
+    """
+    Claves (query, idioma) de los artículos que aún no se han insertado.
+    """
+    return [
+        checkpoints.item_key(query, language)
+        for queries in queries_by_category.values()
+        for query in queries
+        for language in LANGUAGES
+        if checkpoints.item_key(query, language) not in inserted
+    ]
+
+def filter_pending_queries(queries_by_category, completed):
+    """
+    Quita las queries cuyos artículos ya se insertaron en todos los idiomas.
+    """
+    return {
+        category_name: [
+            query for query in queries
+            if not all(checkpoints.item_key(query, language) in completed for language in LANGUAGES)
+        ]
+        for category_name, queries in queries_by_category.items()
+    }
+
+def generate_and_insert_mongodb(queries_by_category, workers=GENERATION_WORKERS, checkpoint=None):
+    """
+    Genera de forma concurrente los artículos de todas las categorías y los inserta
+    en MongoDB a medida que están listos.
 
     Args:
-        category_articles: Lista de artículos de la categoría
-        category_name: Nombre de la categoría (str)
-    """
-    db_data = []
-
-    for query in category_queries:
-        response = qdrant.search_points_semantically(query)
-        qdrant_data = qdrant.get_texts_and_urls(response)
-        languages = ["español", "inglés"]
-        for language in languages:
-            generated_article_response = safe_generate_article(qdrant_data.get("texts", []), language)
-
-            if not generated_article_response:
-                print(f"Error al generar el artículo '{query}': No se recibió respuesta válida.")
-                continue
-
-            try:
-                article_payload = json.loads(generated_article_response)
-            except Exception as e:
-                print(f"Error al generar o parsear el artículo '{query}': {e}")
-                continue
-
-            article_payload["urls"] = qdrant_data.get("urls", [])
-            article_payload["category"] = category_name
-            article_payload["created_at"] = datetime.datetime.now(datetime.timezone.utc)
-            db_data.append(article_payload)
-
-    if db_data:
-        articles.insert_many(db_data)
-        print(f"Artículos de la categoría '{category_name}' insertados en MongoDB.")
-
-
-def main():
-
-    qdrant.delete_all_points()
-
-    fuentes = {
-        "https://www.elmundo.es/": {
-            "internacional": "internacional",
-            "espana": "politica",
-            "deportes": "deportes",
-            "economia": "economia"
-        },
-        "https://elpais.com/": {
-            "internacional/": "internacional",
-            "espana/": "politica",
-            "sociedad/": "sociedad",
-            "deportes/": "deportes",
-            "tecnologia/": "tecnologia",
-            "economia/": "economia"
-        },
-        "https://www.lavanguardia.com/": {
-            "internacional": "internacional",
-            "politica": "politica",
-            "vida": "sociedad",
-            "deportes": "deportes",
-            "tecnologia": "tecnologia",
-            "economia": "economia"
-        },
-        "https://www.abc.es/": {
-            "internacional/": "internacional",
-            "espana/": "politica",
-            "sociedad/": "sociedad",
-            "deportes/": "deportes",
-            "tecnologia/": "tecnologia",
-            "economia/": "economia"
-        },
-        "https://www.larazon.es/": {
-            "internacional/": "internacional",
-            "espana/": "politica",
-            "sociedad/": "sociedad",
-            "deportes/": "deportes",
-            "tecnologia/": "tecnologia",
-            "economia/": "economia"
-        }
+        queries_by_category: Diccionario {categoria: [queries]}
+        workers: Número de hilos de generación
+        checkpoint: RunCheckpoint opcional; cada artículo insertado se registra por
+            (query, idioma) y al reanudar solo se generan los que faltan
+
+    Returns:
+        Claves (query, idioma) de los artículos que no se pudieron generar o insertar
+    """
+    if GEMINI_BATCH_MODE:
+        return generate_and_insert_mongodb_batch(queries_by_category, checkpoint)
+
+    completed = checkpoint.completed_items("insert") if checkpoint else {}
+    inserted = set(completed)
+
+    def generate(query, qdrant_data, language, category_name):
+        response = safe_generate_article(qdrant_data.get("texts", []), language)
+        return response, build_article_payload(response, query, qdrant_data, category_name)
+
+    def translate(source_response, query, qdrant_data, language, category_name):
+        response = safe_translate_article(source_response, language)
+        return response, build_article_payload(response, query, qdrant_data, category_name)
+
+    # En modo "translate" solo se genera el primer idioma y el resto se traduce
+    # en cuanto está listo; en modo "full" se generan todos desde los fragmentos.
+    generated_languages = LANGUAGES[:1] if GENERATION_MODE == "translate" else LANGUAGES
+
+    def is_completed(query, language):
+        return checkpoints.item_key(query, language) in completed
+
+    writer = storage.ArticleWriter()
+    retrieved = retrieve_all(filter_pending_queries(queries_by_category, completed))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        generations = {}
+
+        def submit_translations(source_response, query, qdrant_data, category_name):
+            for language in LANGUAGES[1:]:
+                if is_completed(query, language):
+                    continue
+                translation = executor.submit(translate, source_response, query, qdrant_data, language, category_name)
+                generations[translation] = (query, qdrant_data, category_name, language, False)
+
+        for category_name, query, qdrant_data in retrieved:
+            for language in generated_languages:
+                if is_completed(query, language):
+                    # Reanudación en modo "translate": el original ya existe, faltan traducciones
+                    if GENERATION_MODE == "translate":
+                        submit_translations(completed[checkpoints.item_key(query, language)], query, qdrant_data, category_name)
+                    continue
+                future = executor.submit(generate, query, qdrant_data, language, category_name)
+                generations[future] = (query, qdrant_data, category_name, language, True)
+
+        while generations:
+            # El plazo permite escribir los artículos pendientes aunque no termine otra generación
+            done, _ = wait(generations, timeout=writer.flush_seconds or None, return_when=FIRST_COMPLETED)
+            writer.flush_if_due()
+            for future in done:
+                query, qdrant_data, category_name, language, is_source = generations.pop(future)
+                response, article_payload = future.result()
+                if not article_payload:
+                    continue
+                insert_article(writer, article_payload, query, language,
+                               checkpoint_item(checkpoint, query, language, response, inserted))
+                if is_source and GENERATION_MODE == "translate":
+                    submit_translations(response, query, qdrant_data, category_name)
+
+    writer.flush()
+    logger.info(f"Insertados {writer.written} artículos en MongoDB.")
+    logger.info(f"Uso de Gemini por tipo de llamada e idioma: {gemini.get_usage_stats()}")
+    logger.info(f"Caché de generaciones: {generation_cache.get_stats()}")
+    return pending_items(queries_by_category, inserted)
+
+def generate_and_insert_mongodb_batch(queries_by_category, checkpoint=None):
+    """
+    Igual que generate_and_insert_mongodb, pero envía todas las generaciones como un
+    único trabajo de la Batch API de Gemini y después inserta los resultados.
+    """
+    completed = checkpoint.completed_items("insert") if checkpoint else {}
+    inserted = set(completed)
+    jobs = {}
+    for category_name, query, qdrant_data in retrieve_all(filter_pending_queries(queries_by_category, completed)):
+        for language in LANGUAGES:
+            if checkpoints.item_key(query, language) not in completed:
+                jobs[f"{len(jobs)}"] = (category_name, query, qdrant_data, language)
+
+    if not jobs:
+        return []
+
+    # Solo se envían al trabajo batch las generaciones que no están en la caché
+    results = {}
+    cache_keys = {}
+    for key, (_, _, qdrant_data, language) in jobs.items():
+        cache_keys[key] = generation_cache.make_key(qdrant_data.get("texts", []), language, gemini.GEMINI_MODEL)
+        cached = generation_cache.get(cache_keys[key])
+        if cached is not None:
+            results[key] = cached
+
+    pending = [
+        (key, qdrant_data.get("texts", []), language)
+        for key, (_, _, qdrant_data, language) in jobs.items()
+        if key not in results
+    ]
+    if pending:
+        start = time.perf_counter()
+        batch_results = gemini.generate_articles_batch(pending, GEMINI_BATCH_FILE, poll_interval=GEMINI_BATCH_POLL_INTERVAL)
+        # El coste de un trabajo batch se reparte entre sus peticiones
+        cost_seconds = (time.perf_counter() - start) / len(pending)
+        for key, response in batch_results.items():
+            results[key] = response
+            if response and is_valid_article_json(response):
+                generation_cache.put(cache_keys[key], response, 0, cost_seconds)
+
+    writer = storage.ArticleWriter()
+    for key, (category_name, query, qdrant_data, language) in jobs.items():
+        article_payload = build_article_payload(results.get(key), query, qdrant_data, category_name)
+        if article_payload:
+            insert_article(writer, article_payload, query, language,
+                           checkpoint_item(checkpoint, query, language, results.get(key), inserted))
+
+    writer.flush()
+    logger.info(f"Insertados {writer.written} artículos en MongoDB.")
+    logger.info(f"Caché de generaciones: {generation_cache.get_stats()}")
+    return pending_items(queries_by_category, inserted)
+
+
+FUENTES = {
+    "https://www.elmundo.es/": {
+        "internacional": "internacional",
+        "espana": "politica",
+        "deportes": "deportes",
+        "economia": "economia"
+    },
+    "https://elpais.com/": {
+        "internacional/": "internacional",
+        "espana/": "politica",
+        "sociedad/": "sociedad",
+        "deportes/": "deportes",
+        "tecnologia/": "tecnologia",
+        "economia/": "economia"
+    },
+    "https://www.lavanguardia.com/": {
+        "internacional": "internacional",
+        "politica": "politica",
+        "vida": "sociedad",
+        "deportes": "deportes",
+        "tecnologia": "tecnologia",
+        "economia": "economia"
+    },
+    "https://www.abc.es/": {
+        "internacional/": "internacional",
+        "espana/": "politica",
+        "sociedad/": "sociedad",
+        "deportes/": "deportes",
+        "tecnologia/": "tecnologia",
+        "economia/": "economia"
+    },
+    "https://www.larazon.es/": {
+        "internacional/": "internacional",
+        "espana/": "politica",
+        "sociedad/": "sociedad",
+        "deportes/": "deportes",
+        "tecnologia/": "tecnologia",
+        "economia/": "economia"
     }
+}
+
+CATEGORIAS = ["economia", "tecnologia", "deportes", "sociedad", "politica", "internacional"]
 
-    for base_url, secciones in fuentes.items():
-        for path, categoria in secciones.items():
-            qdrant.populate_qdrant(
-                url=f"{base_url}{path}",
-                language="es",
-                category=categoria
-            )
+# Etapas que ejecuta cada subcomando; "run" es el pipeline completo
+COMMANDS = {
+    "run": ["crawl", "fragment", "upsert", "select_topics", "generate", "notify"],
+    "crawl": ["crawl", "fragment"],
+    "ingest": ["upsert"],
+    "generate": ["select_topics", "generate"],
+    "notify": ["notify"],
+}
 
-    most_relevant = safe_most_relevant_articles()
 
-    categorias = ["economia", "tecnologia", "deportes", "sociedad", "politica", "internacional"]
+def load_stage_output(checkpoint, stage):
+    """
+    Devuelve la salida guardada de una etapa anterior, necesaria para ejecutar otra por separado.
+    """
+    if not checkpoint.is_done(stage):
+        raise RuntimeError(f"La etapa {stage} no se ha completado en la ejecución {checkpoint.run_id}.")
+    return checkpoint.load(stage)
+
+
+def run_crawl(checkpoint, force=False):
+    """
+    crawl: descarga y parseo de secciones y artículos (crawler ya devuelve los fragmentos de cada página).
+
+    El índice de URLs de la ejecución se guarda en el checkpoint "crawl.urls" y se
+    registra en url_index cuando termina la ingesta.
+    """
+    if checkpoint.is_done("crawl") and not force:
+        all_fragments = checkpoint.load("crawl")
+    else:
+        # Con "rebuild" se vacía la colección, así que hay que volver a insertar todos los artículos
+        index = url_index.URLIndex(
+            skip_unchanged=url_index.URL_INDEX_SKIP_UNCHANGED and INGEST_MODE != "rebuild",
+            has_points=qdrant.urls_with_points,
+        )
+        with telemetry.stage("crawl"):
+            all_fragments = []
+            for section_url, categoria, fragments in crawler.crawl_sections(FUENTES, language="es", index=index):
+                if not fragments:
+                    logger.warning(f"No se encontraron fragmentos nuevos para procesar en {section_url}.")
+                all_fragments.extend(fragments)
+            logger.info(f"Caché HTTP de artículos: {http_cache.get_stats()}")
+        checkpoint.save("crawl.urls", index.to_records())
+        checkpoint.save("crawl", all_fragments)
+    telemetry.increment("fragments_total", len(all_fragments), stage="crawl")
+    return all_fragments
+
+
+def run_fragment(checkpoint, all_fragments=None, force=False):
+    """
+    fragment: las noticias de agencia repetidas en varios periódicos se embeben una sola vez.
+    """
+    if checkpoint.is_done("fragment") and not force:
+        all_fragments = checkpoint.load("fragment")
+    else:
+        if all_fragments is None:
+            all_fragments = load_stage_output(checkpoint, "crawl")
+        with telemetry.stage("fragment"):
+            all_fragments = dedup.merge_near_duplicates(all_fragments)
+        checkpoint.save("fragment", all_fragments)
+    telemetry.increment("fragments_total", len(all_fragments), stage="fragment")
+    return all_fragments
 
-    for categoria in categorias:
-        articulos = most_relevant.get(categoria, [])
-        generate_and_insert_mongodb(articulos, categoria)
 
-    notifications.send_notifications()
+def run_upsert(checkpoint, run_datetime, all_fragments=None, force=False):
+    """
+    embed + upsert: se ejecutan solapados en el pipeline de embeddings. Si se
+    interrumpen, al reanudar los puntos ya insertados se conservan (ingesta
+    incremental) y los embeddings guardados en embedding_store no se recalculan.
+    """
+    if checkpoint.is_done("upsert") and not force:
+        return checkpoint.load("upsert")
+    if all_fragments is None:
+        all_fragments = load_stage_output(checkpoint, "fragment")
+
+    with telemetry.stage("upsert"):
+        existing_ids = None
+        if INGEST_MODE == "rebuild":
+            qdrant.delete_all_points()
+        else:
+            # Los fragmentos de puntos calculados con otro modelo se vuelven a embeber:
+            # esos puntos se eliminan y no cuentan como existentes
+            stale = qdrant.delete_points_of_other_models()
+            if stale:
+                logger.warning(f"{stale} puntos calculados con otro modelo de embeddings; se vuelven a generar.")
+            existing_ids = qdrant.get_all_point_ids(query_filter=qdrant.current_model_filter())
+            logger.info(f"Puntos existentes en Qdrant: {len(existing_ids)}")
+
+        logger.info(f"Generando embeddings para {len(all_fragments)} fragmentos...")
+        result = qdrant.batch_embedding_and_upsert(all_fragments, existing_ids=existing_ids, current_datetime=run_datetime)
+        added = result["added"]
+        kept = result["kept"]
+
+        url_records = checkpoint.load("crawl.urls") if checkpoint.is_done("crawl.urls") else {}
+        unchanged_urls = [url for url, entry in url_records.items() if entry.get("unchanged")]
+        refreshed = result["refreshed"]
+        if unchanged_urls:
+            refreshed_ids = qdrant.refresh_urls(unchanged_urls, run_datetime)
+            if refreshed_ids is None:
+                refreshed = False
+            else:
+                kept = kept | refreshed_ids
+                logger.info(f"Conservados {len(refreshed_ids)} fragmentos de {len(unchanged_urls)} artículos sin cambios.")
+        # Las URLs con fragmentos perdidos no se registran, para volver a procesarlas en la siguiente ejecución
+        failed_urls = result["failed_urls"]
+        if failed_urls:
+            logger.warning(f"{len(failed_urls)} artículos con fragmentos sin insertar; se reintentarán en la siguiente ejecución.")
+        url_index.record({url: entry for url, entry in url_records.items() if url not in failed_urls})
+
+        expired = 0
+        if not refreshed:
+            # Los puntos conservados mantienen su datetime anterior: caducarlos ahora los borraría
+            logger.error("No se pudo actualizar la fecha de los puntos conservados; no se eliminan puntos caducados.")
+        elif INGEST_MODE != "rebuild":
+            cutoff = run_datetime - datetime.timedelta(hours=QDRANT_RETENTION_HOURS)
+            expired = qdrant.delete_points_before(cutoff)
+        logger.info(f"Ingesta ({INGEST_MODE}): {len(added)} añadidos, {len(kept - added)} conservados, {expired} caducados.")
+    summary = {"added": len(added), "kept": len(kept - added), "expired": expired}
+    checkpoint.save("embed", summary)
+    checkpoint.save("upsert", summary)
+    return summary
+
+
+def run_select_topics(checkpoint, force=False):
+    if checkpoint.is_done("select_topics") and not force:
+        return checkpoint.load("select_topics")
+    with telemetry.stage("select_topics"):
+        most_relevant = safe_most_relevant_articles()
+    checkpoint.save("select_topics", most_relevant)
+    return most_relevant
+
+
+def run_generate(checkpoint, most_relevant=None, force=False):
+    """
+    generate + insert: cada artículo se registra al insertarse, así que al reanudar
+    (o al relanzar la etapa) solo se generan las (query, idioma) que faltan. La
+    etapa solo se da por completada si no falló ningún artículo.
+    """
+    if checkpoint.is_done("insert") and not force:
+        return
+    if most_relevant is None:
+        most_relevant = load_stage_output(checkpoint, "select_topics")
+    with telemetry.stage("generate"):
+        pending = generate_and_insert_mongodb(
+            {categoria: most_relevant.get(categoria, []) for categoria in CATEGORIAS},
+            checkpoint=checkpoint
+        )
+    if pending:
+        logger.warning(f"{len(pending)} artículos sin generar; se reintentarán al reanudar la ejecución.")
+        return
+    checkpoint.save("generate")
+    checkpoint.save("insert")
+
+
+def run_notify(checkpoint, force=False):
+    """
+    notify: el registro de entregas evita repetir correos aunque la etapa se relance.
+    """
+    if checkpoint.is_done("notify") and not force:
+        return
+    with telemetry.stage("notify"):
+        notifications.send_notifications()
+    checkpoint.save("notify")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pipeline de generación de noticias de GenNews.")
+    parser.add_argument("command", nargs="?", default="run", choices=list(COMMANDS),
+                        help="run ejecuta el pipeline completo; el resto, solo sus etapas sobre la ejecución indicada")
+    parser.add_argument("--run-id", default=PIPELINE_RUN_ID,
+                        help="Ejecución sobre la que se trabaja (por defecto, la del día)")
+    parser.add_argument("--resume", action="store_true", default=PIPELINE_RESUME,
+                        help="Con run, reanuda la ejecución saltando las etapas ya completadas")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Ejecuta el pipeline completo o, con un subcomando, solo algunas etapas.
+
+    Los subcomandos de una etapa siempre trabajan sobre la ejecución existente
+    (las salidas de las etapas anteriores se leen de sus checkpoints) y vuelven a
+    ejecutar sus etapas aunque ya constaran como completadas.
+    """
+    args = parse_args(argv)
+    telemetry.configure_logging()
+    stages = COMMANDS[args.command]
+    single = args.command != "run"
+    checkpoint = checkpoints.RunCheckpoint(args.run_id, resume=args.resume or single)
+    if args.resume and not single:
+        logger.info(f"Reanudando la ejecución {checkpoint.run_id}.")
+    # Una ejecución reanudada conserva la fecha de ingesta de la original
+    run_datetime = datetime.datetime.fromisoformat(checkpoint.get_or_set(
+        "run_datetime", datetime.datetime.now(datetime.timezone.utc).isoformat()
+    ))
+    if {"generate", "notify"} & set(stages):
+        storage.ensure_indexes()
+
+    summary = {}
+    all_fragments = None
+    most_relevant = None
+    try:
+        if "crawl" in stages:
+            all_fragments = run_crawl(checkpoint, force=single)
+        if "fragment" in stages:
+            all_fragments = run_fragment(checkpoint, all_fragments, force=single)
+        if "upsert" in stages:
+            summary = run_upsert(checkpoint, run_datetime, all_fragments, force=single)
+        if "select_topics" in stages:
+            # generate solo vuelve a pedir los temas si aún no se habían elegido
+            most_relevant = run_select_topics(checkpoint)
+        if "generate" in stages:
+            run_generate(checkpoint, most_relevant, force=single)
+        if "notify" in stages:
+            run_notify(checkpoint, force=single)
+    finally:
+        telemetry.write_report({
+            "run_id": checkpoint.run_id,
+            "command": args.command,
+            "ingest": summary,
+            "http_cache": http_cache.get_stats(),
+            "generation_cache": generation_cache.get_stats(),
+            "gemini_usage": gemini.get_usage_stats(),
+        })
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,59 +1,138 @@
+import logging
 import os
-from mailersend import MailerSendClient, EmailBuilder
-from dotenv import load_dotenv
-from pymongo import MongoClient
+import mail_dispatch
+import storage
+import resources
 from datetime import datetime, timezone
 
-load_dotenv()
+resources.load_env()
+
+logger = logging.getLogger(__name__)
 
 MAILERSEND_API_KEY = os.environ.get("MAILERSEND_API_KEY")
-MONGODB_URI = os.environ.get("MONGODB_URI")
 
-client = MongoClient(MONGODB_URI)
-db = client["tfg_db"]
-users = db["users"]
-articles = db["articles"]
 
-ms = MailerSendClient()
+def _create_mailersend():
+  # El SDK de MailerSend se importa solo si se llegan a enviar correos
+  from mailersend import MailerSendClient
+  return MailerSendClient()
+
+
+resources.register("mailersend", _create_mailersend)
+resources.register("mail_provider", lambda: mail_dispatch.get_provider(lambda: resources.get("mailersend")))
+
+MAIL_FROM_EMAIL = "GenNews@test-nrw7gymdnzrg2k8e.mlsender.net"
+MAIL_FROM_NAME = "GenNews"
+ARTICLE_URL = "https://gennews.vercel.app/articles/{}"
+SUBJECT = "Nuevos artículos en tus categorías suscritas"
+
+def load_todays_articles(language="es"):
+  """
+  Carga con una sola consulta los artículos de hoy en el idioma dado y los
+  agrupa en un índice {categoria: [artículos]}, conservando el orden de la colección.
+  """
+  today = datetime.now(timezone.utc).date()
+  start = datetime.combine(today, datetime.min.time())
+  by_category = {}
+  cursor = storage.get_database()["articles"].find(
+    {"language": language, "created_at": {"$gte": start}},
+    {"title": 1, "category": 1}
+  )
+  for position, article in enumerate(cursor):
+    article["position"] = position
+    by_category.setdefault(article.get("category"), []).append(article)
+  return by_category
+
+def render_article_lists(matching_articles):
+  """
+  Lista de artículos del correo en texto y en HTML.
+  """
+  text = "".join(
+    f"- {article['title']}: {ARTICLE_URL.format(article['_id'])}\n" for article in matching_articles
+  )
+  html = "".join(
+    f"<li><a href='{ARTICLE_URL.format(article['_id'])}'>{article['title']}</a></li>" for article in matching_articles
+  )
+  return text, html
+
+class DigestCache:
+  """
+  Cuerpos de correo ya renderizados por conjunto de categorías: los usuarios
+  suscritos a las mismas categorías (con artículos hoy) comparten la lista.
+  """
+
+  def __init__(self, by_category):
+    self.by_category = by_category
+    self.digests = {}
+
+  def get(self, subscribed_categories):
+    key = tuple(sorted(set(subscribed_categories) & self.by_category.keys()))
+    if not key:
+      return None
+    if key not in self.digests:
+      matching_articles = sorted(
+        (article for category in key for article in self.by_category[category]),
+        key=lambda article: article["position"]
+      )
+      self.digests[key] = render_article_lists(matching_articles)
+    return self.digests[key]
+
+def build_email(user, digest):
+  username = user.get("username")
+  text_list, html_list = digest
+  body = (
+    f"Hola {username},\nAquí tienes los nuevos artículos en tus categorías suscritas:\n\n"
+    f"{text_list}\nSaludos,\nGenNews."
+  )
+  html = (
+    f"<p>Hola {username},</p><p>Aquí tienes los nuevos artículos en tus categorías suscritas:</p>"
+    f"<ul>{html_list}</ul><p>Saludos,<br>GenNews.</p>"
+  )
+  recipients = [{"email": user.get("email"), "name": username}]
+  from mailersend import EmailBuilder
+
+  return (EmailBuilder()
+   .from_email(MAIL_FROM_EMAIL, MAIL_FROM_NAME)
+   .to_many(recipients)
+   .subject(SUBJECT)
+   .html(html)
+   .text(body)
+   .build())
 
 def send_notifications():
-  for user in users.find():
+  """
+  Envía a cada usuario los artículos de hoy de sus categorías suscritas.
+
+  Los artículos se cargan una sola vez y se cruzan con los usuarios en memoria
+  mediante el índice por categoría, en lugar de una consulta por usuario. Los
+  correos se envían con mail_dispatch, que omite a los usuarios ya notificados hoy.
+
+  Returns:
+    Diccionario con el número de correos enviados, omitidos, fallidos y aún en cola
+  """
+  by_category = load_todays_articles()
+  if not by_category:
+    logger.info("No hay artículos nuevos hoy: no se envían notificaciones.")
+    return {"sent": 0, "skipped": 0, "failed": 0, "queued": 0}
+
+  digests = DigestCache(by_category)
+  db = storage.get_database()
+  cursor = db["users"].find(
+    {"subscribed_categories": {"$exists": True, "$ne": []}},
+    {"email": 1, "username": 1, "subscribed_categories": 1}
+  )
+  messages = []
+  for user in cursor:
+    digest = digests.get(user.get("subscribed_categories") or [])
+    if not digest:
+      continue
     email = user.get("email")
-    subscribed_categories = user.get("subscribed_categories", [])
-
-    if subscribed_categories:
-      today = datetime.now(timezone.utc).date()
-      start = datetime.combine(today, datetime.min.time())
-      matching_articles = list(articles.find({
-        "category": {"$in": subscribed_categories},
-        "language": "es",
-        "created_at": {"$gte": start}
-      }))
-      if matching_articles:
-        mail_body = {}
-        mail_from = {"email": "GenNews@test-nrw7gymdnzrg2k8e.mlsender.net", "name": "GenNews"}
-        recipients = [{"email": email, "name": user.get("username")}]
-        article_list = "\n".join([f"- {article['title']}" for article in matching_articles])
-        subject = "Nuevos artículos en tus categorías suscritas"
-
-        body = f"Hola {user.get('username')},\nAquí tienes los nuevos artículos en tus categorías suscritas:\n\n"
-        for article in matching_articles:
-            body += f"- {article['title']}: https://gennews.vercel.app/articles/{article['_id']}\n"
-        body += "\nSaludos,\nGenNews."
-
-        html = f"<p>Hola {user.get('username')},</p><p>Aquí tienes los nuevos artículos en tus categorías suscritas:</p><ul>"
-        for article in matching_articles:
-            html += f"<li><a href='https://gennews.vercel.app/articles/{article['_id']}'>{article['title']}</a></li>"
-        html += "</ul><p>Saludos,<br>GenNews.</p>"
-
-        notification_email = (EmailBuilder()
-         .from_email("GenNews@test-nrw7gymdnzrg2k8e.mlsender.net", "GenNews")
-         .to_many(recipients)
-         .subject(subject)
-         .html(html)
-         .text(body)
-         .build())
-        try:
-          response = ms.emails.send(notification_email)
-        except Exception as e:
-          print(f"Error al enviar el correo a {email}: {e}")
\ No newline at end of file
+    try:
+      messages.append((user["_id"], email, build_email(user, digest)))
+    except Exception as e:
+      logger.error(f"Error al preparar el correo a {email}: {e}")
+
+  stats = mail_dispatch.dispatch(messages, resources.get("mail_provider"),
+                                 mail_dispatch.DeliveryLog(db["notification_deliveries"]))
+  logger.info(f"Notificaciones: {stats['sent']} enviadas, {stats['skipped']} ya enviadas hoy, {stats['failed']} fallidas, {stats['queued']} en cola.")
+  return stats
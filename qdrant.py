@@ -1,18 +1,39 @@
 import datetime
+import json
+import logging
 import requests
+import http_client
 import scraper
 import embeddings
+import embedding_store
+import embedding_pipeline
 import uuid
 import os
-from dotenv import load_dotenv
+import resources
 
-load_dotenv()
+resources.load_env()
+
+logger = logging.getLogger(__name__)
 
 
 QDRANT_API_URL = os.environ.get('QDRANT_API_URL')
 QDRANT_API_KEY = os.environ.get('QDRANT_API_KEY')
+QDRANT_POOL_MAXSIZE = int(os.environ.get('QDRANT_POOL_MAXSIZE', 4))
+# "qdrant" usa el servicio HTTP; "local" un índice en el propio proceso (local_vectors.py)
+VECTOR_BACKEND = os.environ.get('VECTOR_BACKEND', 'qdrant')
+
+if VECTOR_BACKEND == "local":
+    import local_vectors
+else:
+    http_client.configure_host(QDRANT_API_URL, QDRANT_POOL_MAXSIZE)
 
 def delete_all_points():
+    if VECTOR_BACKEND == "local":
+        store = local_vectors.get_store()
+        store.delete()
+        store.save()
+        logger.info("Todos los puntos han sido eliminados.")
+        return
     headers = {
         "Authorization": f"Bearer {QDRANT_API_KEY}",
         "Content-Type": "application/json"
@@ -24,26 +45,238 @@ def delete_all_points():
     }
     
     try:
-        response = requests.post(
+        response = http_client.post(
             f"{QDRANT_API_URL}/collections/articles/points/delete",
             headers=headers,
             json=payload
         )
         response.raise_for_status()
-        print("Todos los puntos han sido eliminados.")
+        logger.info("Todos los puntos han sido eliminados.")
     except requests.RequestException as e:
-        print(f"Error al eliminar puntos en Qdrant: {e}")
+        logger.error(f"Error al eliminar puntos en Qdrant: {e}")
+
+def current_model_filter():
+    """
+    Filtro de los puntos cuyo embedding calculó el modelo actual (campo "model" del payload).
+    """
+    return {"must": [{"key": "model", "match": {"value": embeddings.get_model_version()}}]}
+
+def get_all_point_ids(page_size=1000, query_filter=None):
+    """
+    Recorre la colección con /points/scroll y devuelve el conjunto de ids existentes
+    (solo los que cumplen query_filter, si se pasa).
+    Lanza requests.RequestException si Qdrant no responde, para no confundir
+    una colección inaccesible con una vacía.
+    """
+    if VECTOR_BACKEND == "local":
+        return local_vectors.get_store().get_ids(query_filter)
+    headers = {
+        "Authorization": f"Bearer {QDRANT_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    ids = set()
+    offset = None
+    while True:
+        payload = {"limit": page_size, "with_payload": False, "with_vector": False}
+        if query_filter:
+            payload["filter"] = query_filter
+        if offset is not None:
+            payload["offset"] = offset
+        response = http_client.post(
+            f"{QDRANT_API_URL}/collections/articles/points/scroll",
+            headers=headers,
+            json=payload
+        )
+        response.raise_for_status()
+        result = response.json().get("result", {})
+        ids.update(str(point["id"]) for point in result.get("points", []))
+        offset = result.get("next_page_offset")
+        if offset is None:
+            return ids
+
+def urls_with_points(urls, batch_size=200, page_size=1000):
+    """
+    Devuelve el subconjunto de urls que tienen algún punto en la colección (en su campo
+    "urls") calculado con el modelo de embeddings actual: tras cambiar de modelo hay
+    que volver a procesar todos los artículos.
+    Lanza requests.RequestException si Qdrant no responde.
+    """
+    urls = set(urls)
+    if not urls:
+        return set()
+    if VECTOR_BACKEND == "local":
+        return local_vectors.get_store().urls_with_points(urls, current_model_filter())
+
+    headers = {
+        "Authorization": f"Bearer {QDRANT_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    found = set()
+    pending = sorted(urls)
+    for i in range(0, len(pending), batch_size):
+        offset = None
+        while True:
+            payload = {
+                "limit": page_size,
+                "with_payload": ["urls"],
+                "with_vector": False,
+                "filter": {"must": [
+                    {"key": "urls", "match": {"any": pending[i:i + batch_size]}},
+                    *current_model_filter()["must"],
+                ]},
+            }
+            if offset is not None:
+                payload["offset"] = offset
+            response = http_client.post(
+                f"{QDRANT_API_URL}/collections/articles/points/scroll",
+                headers=headers,
+                json=payload
+            )
+            response.raise_for_status()
+            result = response.json().get("result", {})
+            for point in result.get("points", []):
+                found.update(url for url in point.get("payload", {}).get("urls") or [] if url in urls)
+            offset = result.get("next_page_offset")
+            if offset is None:
+                break
+    return found
+
+def update_points_payload(updates, batch_size=100):
+    """
+    Aplica varias actualizaciones de payload con peticiones a /points/batch.
+
+    Args:
+        updates: Lista de tuplas (payload, ids) o (payload, filtro) si ids es un diccionario
+
+    Returns:
+        True si todas las peticiones se completaron
+    """
+    operations = []
+    for payload, target in updates:
+        if isinstance(target, dict):
+            operations.append({"set_payload": {"payload": payload, "filter": target}})
+        else:
+            target = list(target)
+            for i in range(0, len(target), 1000):
+                operations.append({"set_payload": {"payload": payload, "points": target[i:i + 1000]}})
+    if not operations:
+        return True
+
+    if VECTOR_BACKEND == "local":
+        store = local_vectors.get_store()
+        for operation in operations:
+            update = operation["set_payload"]
+            store.set_payload(update.get("points"), update["payload"], update.get("filter"))
+        return True
+
+    headers = {
+        "Authorization": f"Bearer {QDRANT_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    ok = True
+    for i in range(0, len(operations), batch_size):
+        try:
+            response = http_client.post(
+                f"{QDRANT_API_URL}/collections/articles/points/batch",
+                headers=headers,
+                json={"operations": operations[i:i + batch_size]}
+            )
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logger.error(f"Error al actualizar el payload de puntos en Qdrant: {e}")
+            ok = False
+    return ok
+
+def refresh_urls(urls, current_datetime, batch_size=200):
+    """
+    Actualiza el datetime de todos los fragmentos de las URLs dadas (artículos sin
+    cambios que no se han vuelto a insertar) para que no caduquen.
+    Devuelve el conjunto de ids actualizados, o None si ha fallado alguna petición.
+    """
+    urls = list(urls)
+    ids = set()
+    try:
+        for i in range(0, len(urls), batch_size):
+            ids |= get_all_point_ids(query_filter={"must": [{"key": "urls", "match": {"any": urls[i:i + batch_size]}}]})
+    except requests.RequestException as e:
+        logger.error(f"Error al buscar los puntos de los artículos sin cambios en Qdrant: {e}")
+        return None
+    if not update_points_payload([({"datetime": current_datetime.isoformat()}, ids)]):
+        return None
+    return ids
+
+def delete_points_matching(query_filter, description="puntos"):
+    """
+    Elimina con un borrado filtrado los puntos que cumplen query_filter.
+    Devuelve el número de puntos eliminados.
+    """
+    if VECTOR_BACKEND == "local":
+        store = local_vectors.get_store()
+        deleted = store.delete(query_filter)
+        store.save()
+        if deleted:
+            logger.info(f"Eliminados {deleted} {description}.")
+        return deleted
+
+    headers = {
+        "Authorization": f"Bearer {QDRANT_API_KEY}",
+        "Content-Type": "application/json"
+    }
+
+    try:
+        response = http_client.post(
+            f"{QDRANT_API_URL}/collections/articles/points/count",
+            headers=headers,
+            json={"filter": query_filter, "exact": True}
+        )
+        response.raise_for_status()
+        deleted = response.json().get("result", {}).get("count", 0)
+        if not deleted:
+            return 0
+
+        response = http_client.post(
+            f"{QDRANT_API_URL}/collections/articles/points/delete",
+            headers=headers,
+            json={"filter": query_filter}
+        )
+        response.raise_for_status()
+        logger.info(f"Eliminados {deleted} {description}.")
+        return deleted
+    except requests.RequestException as e:
+        logger.error(f"Error al eliminar {description} en Qdrant: {e}")
+    return 0
+
+def delete_points_before(cutoff_datetime):
+    """
+    Elimina los puntos cuyo datetime es anterior a cutoff_datetime. Devuelve cuántos.
+    """
+    stale_filter = {
+        "must": [
+            {"key": "datetime", "range": {"lt": cutoff_datetime.isoformat()}}
+        ]
+    }
+    return delete_points_matching(stale_filter, "puntos caducados")
+
+def delete_points_of_other_models():
+    """
+    Elimina los puntos cuyo embedding calculó otro modelo (o que no lo indican, de
+    antes de guardarlo en el payload): sus vectores no son comparables con los del
+    modelo actual. Devuelve cuántos.
+    """
+    return delete_points_matching({"must_not": current_model_filter()["must"]}, "puntos de otro modelo de embeddings")
 
 def get_id(text):
     return str(uuid.uuid5(uuid.NAMESPACE_URL, text))
 
-def upsert_points(points_batch):
+def upsert_points(points_batch, current_datetime=None):
     ids = [get_id(p["text"]) for p in points_batch]
     duplicates = [id for id in set(ids) if ids.count(id) > 1]
     if duplicates:
-        print("IDs duplicados detectados:", duplicates)
+        logger.warning(f"IDs duplicados detectados: {duplicates}")
         
-    current_datetime = datetime.datetime.now(datetime.timezone.utc)
+    if current_datetime is None:
+        current_datetime = datetime.datetime.now(datetime.timezone.utc)
+    model_version = embeddings.get_model_version()
     payload = {
         "points": [
             {
@@ -52,77 +285,262 @@ def upsert_points(points_batch):
                 "payload": {
                     "text": point["text"],
                     "url": point["url"],
+                    "urls": point.get("urls") or [point["url"]],
                     "language": point["language"],
                     "category": point["category"],
+                    "categories": point.get("categories") or [point["category"]],
+                    "sections": point.get("sections") or [],
                     "datetime": current_datetime.isoformat(),
+                    "model": model_version,
                 }
             }
             for point in points_batch
         ]
     }
+    if VECTOR_BACKEND == "local":
+        local_vectors.get_store().upsert(payload["points"])
+        logger.info(f"Insertados {len(points_batch)} puntos correctamente.")
+        return True
 
     headers = {
         "Authorization": f"Bearer {QDRANT_API_KEY}",
         "Content-Type": "application/json"
     }
     try:
-        response = requests.put(
+        response = http_client.put(
             f"{QDRANT_API_URL}/collections/articles/points",
             headers=headers,
             json=payload
         )
         response.raise_for_status()
-        print(f"Insertados {len(points_batch)} puntos correctamente.")
+        logger.info(f"Insertados {len(points_batch)} puntos correctamente.")
+        return True
     except requests.RequestException as e:
-        print(f"Error al insertar puntos en Qdrant: {e}")
-
-
-def batch_embedding_and_upsert(fragments, batch_size=30):
-    for i in range(0, len(fragments), batch_size):
-        batch = fragments[i:i + batch_size]
-        texts = [f["text"] for f in batch]
-        embeddings_batch = embeddings.get_embeddings_batch(texts)
-
-        batch_points = []
-        for frag, emb in zip(batch, embeddings_batch):
-            if emb:
-                batch_points.append({
-                    "text": frag.get("text", ""),
-                    "embedding": emb,
-                    "url": frag.get("url", ""),
-                    "language": frag.get("language", "es"),
-                    "category": frag.get("category", "general")
-                })
-
-        if batch_points:
-            upsert_points(batch_points)
-
-def search_points_by_vector(vector):
+        logger.error(f"Error al insertar puntos en Qdrant: {e}")
+    return False
+
+
+def batch_embedding_and_upsert(fragments, batch_size=30, existing_ids=None, current_datetime=None):
+    """
+    Genera los embeddings de los fragmentos y los inserta en Qdrant. Los embeddings
+    en caché se reutilizan y el resto se calcula con embedding_pipeline, que
+    solapa las peticiones a Hugging Face con los upserts; batch_size es el
+    tamaño de lote inicial.
+
+    Si se pasa existing_ids (ingesta incremental), los fragmentos cuyo id ya está
+    en la colección no se vuelven a insertar: solo se actualizan su datetime, sus
+    URLs y sus categorías y secciones.
+    existing_ids se amplía con los ids insertados.
+
+    Returns:
+        Diccionario con los conjuntos de ids añadidos ("added") y conservados ("kept"),
+        "refreshed", False si falló la actualización del datetime de algún punto
+        conservado, y "failed_urls", las URLs con algún fragmento que no se pudo
+        embeber o insertar.
+    """
+    if current_datetime is None:
+        current_datetime = datetime.datetime.now(datetime.timezone.utc)
+    store = embedding_store.get_store(embeddings.get_model_version())
+    added = set()
+    kept = set()
+    refreshed = True
+    failed_urls = set()
+
+    # Un único punto por id: el mismo texto puede aparecer varias veces
+    pending = {}
+    for frag in fragments:
+        pending.setdefault(get_id(frag["text"]), frag)
+
+    if existing_ids is not None:
+        batch_kept = [id for id in pending if id in existing_ids]
+        # Una actualización por combinación de URLs, categorías y secciones, todas en /points/batch
+        updates = {}
+        for id in batch_kept:
+            frag = pending[id]
+            # urls incluye los artículos que ahora comparten el fragmento, para que
+            # refresh_urls y urls_with_points los encuentren en la siguiente ejecución
+            payload = {"datetime": current_datetime.isoformat(), "urls": frag.get("urls") or [frag.get("url", "")]}
+            if frag.get("categories"):
+                payload["categories"] = frag["categories"]
+                payload["sections"] = frag.get("sections") or []
+            updates.setdefault(json.dumps(payload, sort_keys=True), (payload, []))[1].append(id)
+        refreshed = update_points_payload(list(updates.values()))
+        kept.update(batch_kept)
+        for id in batch_kept:
+            del pending[id]
+
+    def upsert(pairs):
+        batch_points = [
+            {
+                "text": frag.get("text", ""),
+                "embedding": emb,
+                "url": frag.get("url", ""),
+                "urls": frag.get("urls") or [frag.get("url", "")],
+                "language": frag.get("language", "es"),
+                "category": frag.get("category", "general"),
+                "categories": frag.get("categories"),
+                "sections": frag.get("sections"),
+            }
+            for frag, emb in pairs
+        ]
+        if upsert_points(batch_points, current_datetime):
+            return {get_id(point["text"]) for point in batch_points}
+        failed_urls.update(url for point in batch_points for url in point["urls"])
+        return set()
+
+    def embed(texts):
+        vectors = embeddings.request_embeddings_batch(texts)
+        store.add([get_id(text) for text in texts], vectors)
+        return vectors
+
+    # Los fragmentos con embedding en caché se insertan directamente;
+    # el resto pasa por el pipeline de embeddings + upsert
+    cached = store.lookup(list(pending))
+    cached_pairs = [(pending[id], emb) for id, emb in cached.items()]
+    for i in range(0, len(cached_pairs), batch_size):
+        added.update(upsert(cached_pairs[i:i + batch_size]))
+
+    missing = [frag for id, frag in pending.items() if id not in cached]
+    results, lost = embedding_pipeline.embed_and_upsert(missing, embed, upsert, batch_size)
+    for result in results:
+        added.update(result)
+
+    if existing_ids is not None:
+        existing_ids.update(added)
+
+    store.save()
+    if VECTOR_BACKEND == "local":
+        local_vectors.get_store().save()
+    logger.info(f"Embeddings reutilizados de la caché: {len(cached)}/{len(pending)}")
+    if lost:
+        logger.error(f"No se pudieron generar embeddings para {len(lost)} fragmentos.")
+        failed_urls.update(url for frag in lost for url in frag.get("urls") or [frag.get("url", "")])
+    return {"added": added, "kept": kept, "refreshed": refreshed, "failed_urls": failed_urls}
+
+def search_points_by_vector(vector, limit=9, query_filter=None, with_vector=False):
+    if VECTOR_BACKEND == "local":
+        return local_vectors.get_store().search(vector, limit, query_filter, with_vector)
     headers = {
         "Authorization": f"Bearer {QDRANT_API_KEY}",
         "Content-Type": "application/json"
     }
+    payload = {
+        "limit": limit,
+        "with_payload": True,
+        "with_vector": with_vector,
+        "query": vector
+    }
+    if query_filter:
+        payload["filter"] = query_filter
 
     try:
-        response = requests.post(
+        response = http_client.post(
             f"{QDRANT_API_URL}/collections/articles/points/query",
             headers=headers,
-            json={
-                "limit": 9,
-                "with_payload": True,
-                "query": vector
-            },
+            json=payload,
         )
         response.raise_for_status()
         return response.json().get("result", [])
     except requests.RequestException as e:
-        print(f"Error en busqueda de Qdrant: {e}")
+        logger.error(f"Error en busqueda de Qdrant: {e}")
     
     return []
 
-def search_points_semantically(search_query: str):
+def search_points_semantically(search_query: str, limit=9, query_filter=None):
     embedding = embeddings.get_embedding(embeddings.get_detailed_instruct(search_query))
-    return search_points_by_vector(embedding)
+    return search_points_by_vector(embedding, limit, query_filter)
+
+def build_filter(category=None, language=None, since=None):
+    """
+    Filtro de Qdrant sobre el payload que escribe upsert_points: categoría, idioma
+    y fecha de ingesta mínima (datetime). Devuelve None si no hay condiciones.
+    """
+    must = []
+    if category:
+        # "categories" guarda todas las secciones en las que apareció el artículo;
+        # "category" cubre los puntos insertados antes de que existiera
+        must.append({"should": [
+            {"key": "categories", "match": {"value": category}},
+            {"key": "category", "match": {"value": category}},
+        ]})
+    if language:
+        must.append({"key": "language", "match": {"value": language}})
+    if since:
+        must.append({"key": "datetime", "range": {"gte": since.isoformat()}})
+    return {"must": must} if must else None
+
+def search_points_by_vectors(vectors, limits=9, query_filters=None, with_vector=False):
+    """
+    Ejecuta varias búsquedas en una sola petición a /points/query/batch.
+
+    Args:
+        vectors: Lista de vectores de consulta
+        limits: Límite común (int) o lista con el límite de cada búsqueda
+        query_filters: None o lista con el filtro (o None) de cada búsqueda
+        with_vector: Si se devuelven también los vectores de los puntos
+
+    Returns:
+        Lista con un resultado por búsqueda, en el mismo formato que search_points_by_vector
+    """
+    if isinstance(limits, int):
+        limits = [limits] * len(vectors)
+    if query_filters is None:
+        query_filters = [None] * len(vectors)
+    if VECTOR_BACKEND == "local":
+        store = local_vectors.get_store()
+        return [store.search(vector, limit, query_filter, with_vector)
+                for vector, limit, query_filter in zip(vectors, limits, query_filters)]
+
+    headers = {
+        "Authorization": f"Bearer {QDRANT_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    searches = []
+    for vector, limit, query_filter in zip(vectors, limits, query_filters):
+        search = {"query": vector, "limit": limit, "with_payload": True, "with_vector": with_vector}
+        if query_filter:
+            search["filter"] = query_filter
+        searches.append(search)
+
+    try:
+        response = http_client.post(
+            f"{QDRANT_API_URL}/collections/articles/points/query/batch",
+            headers=headers,
+            json={"searches": searches},
+        )
+        response.raise_for_status()
+        return response.json().get("result", [])
+    except requests.RequestException as e:
+        logger.error(f"Error en busqueda batch de Qdrant: {e}")
+
+    return [{"points": []} for _ in vectors]
+
+def search_points_semantically_batch(search_queries, limits=9, query_filters=None, with_vector=False):
+    """
+    Busca varias queries con un único embedding por lotes y una única petición a Qdrant.
+    Las queries cuyo embedding falla devuelven un resultado vacío.
+    """
+    if not search_queries:
+        return []
+    vectors = embeddings.get_embeddings_batch([embeddings.get_detailed_instruct(q) for q in search_queries])
+
+    if isinstance(limits, int):
+        limits = [limits] * len(search_queries)
+    if query_filters is None:
+        query_filters = [None] * len(search_queries)
+
+    valid = [i for i, vector in enumerate(vectors) if vector]
+    results = [{"points": []} for _ in search_queries]
+    if valid:
+        batch_results = search_points_by_vectors(
+            [vectors[i] for i in valid],
+            [limits[i] for i in valid],
+            [query_filters[i] for i in valid],
+            with_vector
+        )
+        for i, result in zip(valid, batch_results):
+            results[i] = result
+    return results
 
 def get_texts_and_urls(response):
     points = response["points"]
@@ -134,12 +552,12 @@ def get_texts_and_urls(response):
         payload = point.get("payload", {})
         
         text = payload.get("text")
-        url = payload.get("url")
-        
+        # Un fragmento casi duplicado en varios periódicos guarda todas sus URLs
+        point_urls = payload.get("urls") or [payload.get("url")]
+
         if text:
             texts.append(text)
-        if url:
-            urls_set.add(url)
+        urls_set.update(url for url in point_urls if url)
 
     urls = list(urls_set)
 
@@ -151,14 +569,14 @@ def get_texts_and_urls(response):
     return qdrant_data
 
 def populate_qdrant(url, language, category):
-    print(f"Recopilando enlaces de artículos de {url}...")
+    logger.info(f"Recopilando enlaces de artículos de {url}...")
     articles_urls = scraper.get_main_article_links(url)
-    print(articles_urls)
+    logger.debug(f"Enlaces encontrados: {articles_urls}")
 
     fragments = scraper.extract_text_fragments(articles_urls, language=language, category=category)
 
     if fragments:
-        print(f"Generando embeddings para {len(fragments)} fragmentos...")
+        logger.info(f"Generando embeddings para {len(fragments)} fragmentos...")
         batch_embedding_and_upsert(fragments)
     else:
-        print("No se encontraron fragmentos para procesar.")
\ No newline at end of file
+        logger.warning("No se encontraron fragmentos para procesar.")
\ No newline at end of file
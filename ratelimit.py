@@ -0,0 +1,42 @@
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Limitador de ritmo por cubo de fichas, seguro entre hilos.
+
+    Args:
+        rate: Fichas que se reponen por segundo
+        capacity: Fichas máximas acumulables (ráfaga permitida)
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """
+        Bloquea hasta que haya fichas disponibles y las consume.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def backoff_delay(attempt, base=1.0, maximum=30.0):
+    """
+    Espera exponencial con jitter completo para el intento attempt (desde 1).
+    """
+    return random.uniform(0, min(maximum, base * 2 ** (attempt - 1)))
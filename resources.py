@@ -0,0 +1,62 @@
+import threading
+
+# Registro de recursos compartidos (clientes de MongoDB, Gemini, MailerSend, sesión HTTP...).
+# Cada módulo registra una función que crea su recurso y este solo se construye la
+# primera vez que se pide, de modo que un subcomando que no lo usa no paga su coste.
+
+_factories = {}
+_instances = {}
+_lock = threading.RLock()
+_env_loaded = False
+
+
+def load_env():
+    """
+    Carga el fichero .env una sola vez por proceso.
+    """
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+
+def register(name, factory):
+    """
+    Registra la función que crea el recurso name (sin crearlo).
+    """
+    with _lock:
+        _factories[name] = factory
+
+
+def get(name):
+    """
+    Devuelve el recurso name, creándolo en el primer uso.
+    """
+    instance = _instances.get(name)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(name)
+            if instance is None:
+                instance = _factories[name]()
+                _instances[name] = instance
+    return instance
+
+
+def override(name, instance):
+    """
+    Sustituye un recurso ya creado (p.ej. por un doble de pruebas).
+    """
+    with _lock:
+        _instances[name] = instance
+
+
+def reset(name=None):
+    """
+    Descarta el recurso name (o todos) para que se vuelva a crear en el siguiente uso.
+    """
+    with _lock:
+        if name is None:
+            _instances.clear()
+        else:
+            _instances.pop(name, None)
@@ -0,0 +1,113 @@
+import os
+import numpy as np
+import resources
+
+resources.load_env()
+
+# Candidatos que se piden a Qdrant por cada fragmento que se quiere quedar
+RETRIEVAL_OVERFETCH = int(os.environ.get('RETRIEVAL_OVERFETCH', 4))
+# Peso de la relevancia frente a la diversidad en MMR (1 = solo relevancia)
+RETRIEVAL_MMR_LAMBDA = float(os.environ.get('RETRIEVAL_MMR_LAMBDA', 0.7))
+# Máximo de fragmentos de una misma URL en el contexto de un artículo (0 = sin límite)
+RETRIEVAL_MAX_PER_URL = int(os.environ.get('RETRIEVAL_MAX_PER_URL', 2))
+# Tokens aproximados del contexto que se pasa a Gemini por artículo (0 = sin límite)
+RETRIEVAL_TOKEN_BUDGET = int(os.environ.get('RETRIEVAL_TOKEN_BUDGET', 3500))
+
+
+def estimate_tokens(text):
+    """
+    Estimación barata de tokens: unos 4 caracteres por token en español e inglés.
+    """
+    return len(text) // 4 + 1
+
+
+def mmr_select(points, limit, mmr_lambda=RETRIEVAL_MMR_LAMBDA, max_per_url=RETRIEVAL_MAX_PER_URL,
+               token_budget=RETRIEVAL_TOKEN_BUDGET):
+    """
+    Elige hasta limit puntos de entre los candidatos con máxima relevancia marginal (MMR).
+
+    La relevancia es el score de Qdrant y la redundancia la similitud coseno con los
+    puntos ya elegidos; ambas se calculan con una única matriz de similitudes. Se
+    descartan los candidatos que superan max_per_url fragmentos de la misma URL o que
+    no caben en token_budget.
+
+    Args:
+        points: Candidatos de Qdrant, con "score", "payload" y "vector"
+        limit: Número máximo de puntos elegidos
+
+    Returns:
+        Lista de puntos elegidos, en orden de selección
+    """
+    points = [p for p in points if p.get("vector")]
+    if not points:
+        return []
+
+    vectors = np.asarray([p["vector"] for p in points], dtype=np.float32)
+    vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    similarities = vectors @ vectors.T
+    relevance = np.asarray([p.get("score", 0.0) for p in points], dtype=np.float32)
+    tokens = [estimate_tokens(p.get("payload", {}).get("text") or "") for p in points]
+
+    # Similitud máxima de cada candidato con los ya elegidos
+    redundancy = np.zeros(len(points), dtype=np.float32)
+    available = np.ones(len(points), dtype=bool)
+    per_url = {}
+    used_tokens = 0
+    selected = []
+
+    while len(selected) < limit and available.any():
+        scores = mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        available[best] = False
+
+        url = points[best].get("payload", {}).get("url")
+        if max_per_url and per_url.get(url, 0) >= max_per_url:
+            continue
+        if token_budget and selected and used_tokens + tokens[best] > token_budget:
+            continue
+
+        selected.append(best)
+        per_url[url] = per_url.get(url, 0) + 1
+        used_tokens += tokens[best]
+        redundancy = np.maximum(redundancy, similarities[best])
+
+    return [points[i] for i in selected]
+
+
+def trim_to_budget(points, token_budget=RETRIEVAL_TOKEN_BUDGET):
+    """
+    Conserva los puntos, en su orden, mientras quepan en token_budget (el primero siempre).
+    """
+    if not token_budget:
+        return list(points)
+    kept = []
+    used_tokens = 0
+    for point in points:
+        tokens = estimate_tokens(point.get("payload", {}).get("text") or "")
+        if kept and used_tokens + tokens > token_budget:
+            continue
+        kept.append(point)
+        used_tokens += tokens
+    return kept
+
+
+def limit_context(responses):
+    """
+    Aplica el presupuesto de tokens a cada respuesta de una búsqueda top-k (sin MMR).
+    """
+    return [dict(response, points=trim_to_budget(response.get("points", []))) for response in responses]
+
+
+def diversify(responses, limits):
+    """
+    Aplica mmr_select a cada respuesta de una búsqueda batch hecha con with_vector,
+    y quita los vectores de los puntos elegidos.
+    """
+    if isinstance(limits, int):
+        limits = [limits] * len(responses)
+    results = []
+    for response, limit in zip(responses, limits):
+        chosen = mmr_select(response.get("points", []), limit)
+        results.append({"points": [{k: v for k, v in p.items() if k != "vector"} for p in chosen]})
+    return results
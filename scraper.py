@@ -1,83 +1,102 @@
-import requests
-import re
-from bs4 import BeautifulSoup
+import logging
+import http_client
+import http_cache
+import time
+import extractors
+import fragmenter
 from urllib.parse import urljoin, urlparse, urlunparse
 
-
-# Devuelve el texto útil completo de un artículo dada su URL
-def scrape_article_tag_text(url, min_paragraph_len=100):
+logger = logging.getLogger(__name__)
+
+
+def extractor_key(extract, min_paragraph_len=100):
+    return f"{extract.__name__}:{min_paragraph_len}"
+
+# Descarga una URL reutilizando la caché en disco, sin parsearla.
+# Si la entrada es reciente se sirve sin petición; si no, se revalida con
+# If-None-Match/If-Modified-Since y ante un 304 se evita descargar y parsear.
+# Devuelve {"text": ...} si el texto ya está en caché o, si hay que parsear,
+# la página descargada ({"content": ...}); lanza excepción si la descarga falla.
+def fetch_article(url, extract, min_paragraph_len=100):
+    extractor = extractor_key(extract, min_paragraph_len)
+    cached = http_cache.get(url)
+    if cached and cached["extractor"] == extractor and http_cache.is_fresh(cached):
+        http_cache.record_hit(cached)
+        return {"text": cached["text"]}
+
+    headers = {"User-Agent": "Mozilla/5.0"}
+    if cached:
+        headers.update(http_cache.conditional_headers(cached))
+
+    start = time.perf_counter()
+    response = http_client.get(url, headers=headers)
+
+    if cached and response.status_code == 304:
+        http_cache.touch(url)
+        http_cache.record_not_modified(cached, time.perf_counter() - start)
+        if cached["extractor"] == extractor:
+            return {"text": cached["text"]}
+        # El cuerpo guardado sigue siendo válido, pero se extrajo con otro extractor
+        return {"content": cached["body"], "revalidated": True}
+
+    response.raise_for_status()
+    return {
+        "content": response.content,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "start": start,
+    }
+
+# Guarda en la caché el texto extraído de una página devuelta por fetch_article
+def store_article_text(url, page, text, extract, min_paragraph_len=100):
+    extractor = extractor_key(extract, min_paragraph_len)
+    if page.get("revalidated"):
+        http_cache.update_text(url, text, extractor)
+        return
+    http_cache.record_miss()
+    http_cache.put(
+        url,
+        page["content"],
+        page["etag"],
+        page["last_modified"],
+        text,
+        extractor,
+        time.perf_counter() - page["start"]
+    )
+
+# Descarga una URL y extrae su texto, reutilizando la caché en disco.
+def scrape_cached(url, extract, min_paragraph_len=100):
     try:
-        headers = {"User-Agent": "Mozilla/5.0"}
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-
-        soup = BeautifulSoup(response.content, "html.parser")
-
-        # Intenta extraer desde <article> si existe
-        article = soup.find("article")
-        if article:
-            paragraphs = article.find_all("p")
-        else:
-            paragraphs = soup.find_all("p")
-
-        # Filtra y concatena párrafos decentes
-        text = "\n".join(
-            p.get_text().strip()
-            for p in paragraphs
-            if len(p.get_text().strip()) > min_paragraph_len  # descarta textos irrelevantes
-        )
-
-        return text.strip()
+        page = fetch_article(url, extract, min_paragraph_len)
+        if "text" in page:
+            return page["text"]
+        text = extract(page["content"], min_paragraph_len)
+        store_article_text(url, page, text, extract, min_paragraph_len)
+        return text
 
     except Exception as e:
-        print(f"Error al scrapear la URL: {e}")
+        logger.error(f"Error al scrapear la URL: {e}")
         return ""
-    
-def scrape_section_tag_text(url, min_paragraph_len=100):
-    try:
-        headers = {"User-Agent": "Mozilla/5.0"}
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-
-        soup = BeautifulSoup(response.content, "html.parser")
-
-        # Extrae todos los <section> y sus <p>
-        sections = soup.find_all("section")
-        paragraphs = []
-        for section in sections:
-            paragraphs.extend(section.find_all("p"))
 
-        # Si no hay <section>, usa todos los <p> del documento
-        if not paragraphs:
-            paragraphs = soup.find_all("p")
-
-        # Filtra y concatena párrafos decentes
-        text = "\n".join(
-            p.get_text().strip()
-            for p in paragraphs
-            if len(p.get_text().strip()) > min_paragraph_len
-        )
-
-        return text.strip()
+# Devuelve el texto útil completo de un artículo dada su URL
+def scrape_article_tag_text(url, min_paragraph_len=100):
+    return scrape_cached(url, extractors.extract_article_text, min_paragraph_len)
 
-    except Exception as e:
-        print(f"Error al scrapear la URL: {e}")
-        return ""
+def scrape_section_tag_text(url, min_paragraph_len=100):
+    return scrape_cached(url, extractors.extract_section_text, min_paragraph_len)
 
 # De momento funciona para elmundo, elpais y lavanguardia
 # Obtiene los enlaces de los artículos principales de la portada de un periódico, evitando enlaces no deseados
 def get_main_article_links(base_url, max_links=15):
     try:
         headers = {"User-Agent": "Mozilla/5.0"}
-        response = requests.get(base_url, headers=headers)
+        response = http_client.get(base_url, headers=headers)
         response.raise_for_status()
     except Exception as e:
-        print(f"No se pudo acceder a la portada {base_url}: {e}")
+        logger.error(f"No se pudo acceder a la portada {base_url}: {e}")
         return []
     
-    soup = BeautifulSoup(response.text, "html.parser")
-
-    articles = soup.find_all("article")
+    articles = extractors.parse_only(response.content, "article").find_all("article")
 
     article_links = []
     seen = set()
@@ -119,56 +138,33 @@ def get_main_article_links(base_url, max_links=15):
 
 
 
+# Divide el texto en fragmentos de oraciones completas de entre min_words y max_words palabras.
+# Los fragmentos son trozos del texto original (ver fragmenter.iter_fragment_spans).
 def split_text_into_fragments(texto, max_words=340, min_words=80):
-    # Dividir el texto en oraciones usando puntuación fuerte.
-    sentences = re.split(r'(?<=[.!?])\s+', texto.strip())
-    
-    fragments = []
-    current_fragment = []
-    current_word_count = 0
-
-    for sentence in sentences:
-        sentence_words = sentence.split()
-        word_count = len(sentence_words)
-
-        # Si la oración sola es mayor que el máximo, se añade como fragmento aparte
-        if word_count > max_words:
-            if current_fragment:
-                fragments.append(' '.join(current_fragment))
-                current_fragment = []
-                current_word_count = 0
-            fragments.append(sentence)
-        elif current_word_count + word_count <= max_words:
-            current_fragment.extend(sentence_words)
-            current_word_count += word_count
-        else:
-            # Si el fragmento actual tiene suficientes palabras, lo guardo y empiezo uno nuevo
-            if current_word_count >= min_words:
-                fragments.append(' '.join(current_fragment))
-                current_fragment = sentence_words
-                current_word_count = word_count
-            else:
-                # Si no cumple mínimo, igual se añade la oración para evitar bucles raros
-                current_fragment.extend(sentence_words)
-                current_word_count += word_count
-
-    # Añadir lo que quede
-    if current_fragment:
-        fragments.append(' '.join(current_fragment))
-
-    return fragments
+    return list(fragmenter.iter_fragments(texto, max_words, min_words))
+
+# Convierte el texto de un artículo en la lista de fragmentos que consume el resto del pipeline
+def build_fragments(text, url, language="es", category="general"):
+    return [
+        {"text": fragment, "url": url, "language": language, "category": category}
+        for fragment in fragmenter.fragment_text(text)
+    ]
+
+# Parte CPU del scraping (parseo y fragmentación) de una página ya descargada.
+# Es una función de módulo para poder ejecutarse en un ProcessPoolExecutor.
+def parse_page(extract, content, url, language="es", category="general"):
+    text = extract(content)
+    if not text:
+        return text, []
+    return text, build_fragments(text, url, language, category)
 
 # Combina las funciones de scraping y fragmentación por oraciones y número de palabras para extraer fragmentos de texto de una lista de artículos
 def extract_text_fragments(article_urls, language="es", category="general"):
     all_fragments = []
     for url in article_urls:
-        if urlparse(url).netloc == "www.larazon.es":
-            text = scrape_section_tag_text(url)
-        else:
-            text = scrape_article_tag_text(url)
+        # Cada periódico usa el extractor registrado para su dominio
+        text = scrape_cached(url, extractors.get_extractor(url))
         if not text:
             continue
-        fragments = split_text_into_fragments(text)
-        for fragment in fragments:
-            all_fragments.append({"text": fragment, "url": url, "language": language, "category": category})
-    return all_fragments
\ No newline at end of file
+        all_fragments.extend(build_fragments(text, url, language, category))
+    return all_fragments
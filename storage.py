@@ -0,0 +1,182 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+import resources
+
+resources.load_env()
+
+logger = logging.getLogger(__name__)
+
+# "mongomock://" usa una base de datos en memoria (requiere mongomock), para pruebas
+MONGODB_URI = os.environ.get('MONGODB_URI')
+MONGODB_DATABASE = os.environ.get('MONGODB_DATABASE', 'tfg_db')
+# Artículos acumulados antes de escribir un lote y tiempo máximo (segundos) que espera uno pendiente
+STORAGE_BULK_SIZE = int(os.environ.get('STORAGE_BULK_SIZE', 8))
+STORAGE_FLUSH_SECONDS = float(os.environ.get('STORAGE_FLUSH_SECONDS', 5))
+
+ASCENDING = 1
+DESCENDING = -1
+
+_indexes_ready = False
+
+# Índices compuestos para las consultas de notifications.py y de la web:
+# artículos de hoy por categoría e idioma, y últimos artículos por idioma
+ARTICLE_INDEXES = [
+    ([("category", ASCENDING), ("language", ASCENDING), ("created_at", DESCENDING)], {}),
+    ([("language", ASCENDING), ("created_at", DESCENDING)], {}),
+    ([("content_key", ASCENDING)], {"unique": True, "sparse": True}),
+]
+USER_INDEXES = [
+    ([("subscribed_categories", ASCENDING)], {}),
+]
+
+
+def _create_client():
+    # pymongo se importa aquí: su importación es lenta y no todos los subcomandos usan MongoDB
+    if MONGODB_URI and MONGODB_URI.startswith("mongomock://"):
+        import mongomock
+        return mongomock.MongoClient()
+    from pymongo import MongoClient
+    return MongoClient(MONGODB_URI)
+
+
+resources.register("mongo", _create_client)
+
+
+def get_client():
+    """
+    Devuelve el cliente de MongoDB compartido, creándolo en el primer uso.
+    """
+    return resources.get("mongo")
+
+
+def get_database():
+    return get_client()[MONGODB_DATABASE]
+
+
+def ensure_indexes(db=None):
+    """
+    Crea (si no existen) los índices de articles y users. create_index es idempotente.
+    """
+    from pymongo.errors import PyMongoError
+
+    global _indexes_ready
+    if _indexes_ready and db is None:
+        return
+    db = db if db is not None else get_database()
+    for collection, indexes in (("articles", ARTICLE_INDEXES), ("users", USER_INDEXES)):
+        for keys, options in indexes:
+            try:
+                db[collection].create_index(keys, **options)
+            except PyMongoError as e:
+                logger.error(f"Error al crear el índice {keys} en {collection}: {e}")
+    _indexes_ready = True
+
+
+def is_mongomock(collection):
+    return type(collection).__module__.startswith("mongomock")
+
+
+def content_key(query, language, day=None):
+    """
+    Clave estable de un artículo: el mismo tema del día en el mismo idioma
+    corresponde siempre al mismo documento, aunque se vuelva a generar.
+    """
+    day = day or datetime.now(timezone.utc).date().isoformat()
+    return hashlib.sha256(f"{day}|{language}|{query}".encode("utf-8")).hexdigest()
+
+
+class ArticleWriter:
+    """
+    Escribe artículos en lotes con bulk_write desordenado (un fallo no detiene el
+    resto del lote) y upsert por content_key, de modo que relanzar la generación
+    actualiza los artículos del día en lugar de duplicarlos.
+
+    Los artículos se escriben en cuanto hay STORAGE_BULK_SIZE pendientes o el más
+    antiguo lleva STORAGE_FLUSH_SECONDS esperando. Como add solo lo comprueba al
+    recibir otro artículo, quien espera resultados debe llamar a flush_if_due
+    periódicamente; flush() escribe el resto.
+    """
+
+    def __init__(self, collection=None, bulk_size=STORAGE_BULK_SIZE, flush_seconds=STORAGE_FLUSH_SECONDS):
+        self.collection = collection if collection is not None else get_database()["articles"]
+        self.bulk_size = bulk_size
+        self.flush_seconds = flush_seconds
+        self._pending = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        self.written = 0
+
+    def add(self, article, key, on_written=None):
+        """
+        Encola un artículo. on_written (opcional) se llama cuando se ha escrito.
+        """
+        with self._lock:
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append((article, key, on_written))
+            due = self._is_due()
+        if due:
+            self.flush()
+
+    def _is_due(self):
+        return bool(self._pending) and (
+            len(self._pending) >= self.bulk_size or time.monotonic() - self._oldest >= self.flush_seconds
+        )
+
+    def flush_if_due(self):
+        """
+        Escribe los artículos pendientes si el más antiguo lleva STORAGE_FLUSH_SECONDS esperando.
+        """
+        with self._lock:
+            due = self._is_due()
+        if due:
+            return self.flush()
+        return 0
+
+    def flush(self):
+        from pymongo import UpdateOne
+        from pymongo.errors import BulkWriteError, PyMongoError
+
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+
+        updates = []
+        for article, key, _ in batch:
+            fields = {k: v for k, v in article.items() if k not in ("_id", "created_at")}
+            fields["content_key"] = key
+            updates.append((
+                {"content_key": key},
+                {"$set": fields, "$setOnInsert": {"created_at": article.get("created_at", datetime.now(timezone.utc))}}
+            ))
+
+        failed = set()
+        try:
+            if is_mongomock(self.collection):
+                # mongomock no admite las operaciones de bulk_write de las versiones recientes de pymongo
+                for query, update in updates:
+                    self.collection.update_one(query, update, upsert=True)
+            else:
+                self.collection.bulk_write([UpdateOne(q, u, upsert=True) for q, u in updates], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                failed.add(error["index"])
+                logger.error(f"Error al guardar el artículo '{batch[error['index']][0].get('title')}': {error.get('errmsg')}")
+        except PyMongoError as e:
+            logger.error(f"Error al guardar {len(batch)} artículos en MongoDB: {e}")
+            return 0
+
+        written = 0
+        for index, (article, _, on_written) in enumerate(batch):
+            if index in failed:
+                continue
+            written += 1
+            if on_written:
+                on_written(article)
+        self.written += written
+        return written
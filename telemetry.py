@@ -0,0 +1,217 @@
+import contextlib
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+import resources
+
+resources.load_env()
+
+# "text" (legible) o "json" (un objeto por línea, para agregadores de logs)
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+# Informe JSON de la ejecución y, opcionalmente, exportación en formato de texto de Prometheus
+RUN_REPORT_PATH = os.environ.get('RUN_REPORT_PATH', '.cache/run_report.json')
+PROMETHEUS_PATH = os.environ.get('PROMETHEUS_PATH')
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+_lock = threading.Lock()
+# {(nombre, (etiquetas ordenadas)): valor}
+_counters = {}
+# {(nombre, (etiquetas ordenadas)): [muestras en segundos]}
+_latencies = {}
+_started_at = time.time()
+
+logger = logging.getLogger(__name__)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formatea cada registro como un objeto JSON con los campos pasados en extra.
+    """
+
+    _RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in self._RESERVED})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(fmt=LOG_FORMAT, level=LOG_LEVEL):
+    """
+    Configura el logging raíz del pipeline. Se llama una vez desde el punto de entrada.
+    """
+    handler = logging.StreamHandler()
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+
+
+def _key(name, labels):
+    # Los valores se guardan como texto: un mismo label puede recibir int y str (p.ej. status)
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def increment(name, value=1, **labels):
+    """
+    Suma value al contador name con las etiquetas dadas (p.ej. host, cache).
+    """
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    """
+    Registra una muestra de latencia (segundos) en el histograma name.
+    """
+    key = _key(name, labels)
+    with _lock:
+        _latencies.setdefault(key, []).append(seconds)
+
+
+@contextlib.contextmanager
+def timer(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """
+    Mide una etapa del pipeline y registra su inicio y fin en el log.
+    """
+    logger.info(f"Inicio de la etapa {name}", extra={"stage": name, "event": "stage_start"})
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        observe("stage_seconds", seconds, stage=name)
+        increment("stages_total", stage=name, status=status)
+        logger.info(f"Fin de la etapa {name} ({status}) en {seconds:.2f} s",
+                    extra={"stage": name, "event": "stage_end", "status": status, "seconds": seconds})
+
+
+def quantile(sorted_values, q):
+    """
+    Cuantil con interpolación lineal (como numpy.quantile) de una lista ordenada.
+    """
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(samples):
+    values = sorted(samples)
+    summary = {"count": len(values), "sum": float(sum(values))}
+    for q in QUANTILES:
+        summary[f"p{int(q * 100)}"] = float(quantile(values, q))
+    return summary
+
+
+def _label_string(labels):
+    return ",".join(f"{k}={v}" for k, v in labels)
+
+
+def build_report(extra=None):
+    """
+    Informe de la ejecución: contadores, resumen (p50/p95/p99) de cada histograma
+    y las secciones adicionales que se pasen en extra.
+    """
+    with _lock:
+        counters = dict(_counters)
+        latencies = {key: list(samples) for key, samples in _latencies.items()}
+
+    report = {
+        "started_at": datetime.datetime.fromtimestamp(_started_at, datetime.timezone.utc).isoformat(),
+        "duration_seconds": time.time() - _started_at,
+        "counters": {},
+        "latencies": {},
+    }
+    for (name, labels), value in sorted(counters.items()):
+        report["counters"].setdefault(name, {})[_label_string(labels)] = value
+    for (name, labels), samples in sorted(latencies.items()):
+        report["latencies"].setdefault(name, {})[_label_string(labels)] = summarize(samples)
+    if extra:
+        report.update(extra)
+    return report
+
+
+def _prometheus_labels(labels, **more):
+    items = list(labels) + list(more.items())
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+def to_prometheus():
+    """
+    Exporta contadores y latencias en el formato de texto de Prometheus
+    (las latencias como summary con cuantiles).
+    """
+    with _lock:
+        counters = dict(_counters)
+        latencies = {key: list(samples) for key, samples in _latencies.items()}
+
+    lines = []
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# TYPE pipeline_{name} counter")
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"pipeline_{name}{_prometheus_labels(labels)} {value}")
+    for name in sorted({name for name, _ in latencies}):
+        lines.append(f"# TYPE pipeline_{name} summary")
+        for (metric, labels), samples in sorted(latencies.items()):
+            if metric != name:
+                continue
+            summary = summarize(samples)
+            for q in QUANTILES:
+                lines.append(f"pipeline_{name}{_prometheus_labels(labels, quantile=q)} {summary[f'p{int(q * 100)}']}")
+            lines.append(f"pipeline_{name}_sum{_prometheus_labels(labels)} {summary['sum']}")
+            lines.append(f"pipeline_{name}_count{_prometheus_labels(labels)} {summary['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def _write(path, content):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def write_report(extra=None, path=RUN_REPORT_PATH, prometheus_path=PROMETHEUS_PATH):
+    """
+    Escribe el informe JSON de la ejecución y, si se configura, la exportación de Prometheus.
+    """
+    report = build_report(extra)
+    _write(path, json.dumps(report, ensure_ascii=False, indent=2, default=str))
+    logger.info(f"Informe de la ejecución guardado en {path}")
+    if prometheus_path:
+        _write(prometheus_path, to_prometheus())
+    return report
@@ -0,0 +1,18 @@
+import pytest
+import extractors
+from bench_extractors import FIXTURES_DIR, LEGACY, load_pages
+
+PAGES = load_pages(FIXTURES_DIR)
+
+
+def test_fixtures_cover_every_newspaper():
+    domains = {name.split("_", 1)[0] for name, _ in PAGES}
+    assert domains == {"www.elmundo.es", "elpais.com", "www.lavanguardia.com", "www.abc.es", "www.larazon.es"}
+
+
+@pytest.mark.parametrize("name, content", PAGES, ids=[name for name, _ in PAGES])
+def test_same_text_as_legacy_extractor(name, content):
+    extractor = extractors.get_extractor(f"https://{name.split('_', 1)[0]}/")
+    text = extractor(content)
+    assert text
+    assert text == LEGACY[extractor](content)
@@ -0,0 +1,77 @@
+import pytest
+import fragmenter
+from bench_fragmenter import legacy_split_text_into_fragments, synthetic_article
+
+
+def words_per_fragment(fragments):
+    return [fragment.split() for fragment in fragments]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_same_words_per_fragment_as_legacy_splitter(seed):
+    text = synthetic_article(words=5000, seed=seed)
+    expected = legacy_split_text_into_fragments(text)
+    assert words_per_fragment(fragmenter.iter_fragments(text)) == words_per_fragment(expected)
+
+
+@pytest.mark.parametrize("max_size, min_size", [(50, 10), (20, 15), (8, 2)])
+def test_same_words_per_fragment_as_legacy_splitter_with_other_sizes(max_size, min_size):
+    text = synthetic_article(words=2000, seed=42)
+    expected = legacy_split_text_into_fragments(text, max_size, min_size)
+    assert words_per_fragment(fragmenter.iter_fragments(text, max_size, min_size)) == words_per_fragment(expected)
+
+
+def test_fragments_are_slices_of_the_original_text():
+    text = "Primera frase corta.\n\nSegunda   frase! ¿Tercera? Cuarta."
+    spans = list(fragmenter.iter_fragment_spans(text, max_size=3, min_size=1))
+    assert [text[start:end] for start, end in spans] == ["Primera frase corta.", "Segunda   frase! ¿Tercera?", "Cuarta."]
+
+
+def test_empty_text_has_no_fragments():
+    assert fragmenter.fragment_text("") == []
+    assert fragmenter.fragment_text("   \n ") == []
+
+
+def test_oversize_sentence_is_its_own_fragment():
+    long_sentence = " ".join(["palabra"] * 12) + "."
+    text = f"Uno dos tres. {long_sentence} Cuatro cinco."
+    fragments = list(fragmenter.iter_fragments(text, max_size=10, min_size=1))
+    assert fragments == ["Uno dos tres.", long_sentence, "Cuatro cinco."]
+    assert fragments == legacy_split_text_into_fragments(text, 10, 1)
+
+
+def test_short_fragment_absorbs_next_sentence_below_min_size():
+    text = "Uno dos. Tres cuatro cinco seis siete."
+    assert list(fragmenter.iter_fragments(text, max_size=5, min_size=3)) == [text]
+
+
+def test_overlap_repeats_last_sentences_of_previous_fragment():
+    text = "A a. B b. C c. D d. E e."
+    fragments = list(fragmenter.iter_fragments(text, max_size=4, min_size=1, overlap=1))
+    assert fragments == ["A a. B b.", "B b. C c.", "C c. D d.", "D d. E e."]
+
+
+def test_overlap_is_dropped_when_it_does_not_fit():
+    text = "A a a. B b b. C c c."
+    fragments = list(fragmenter.iter_fragments(text, max_size=5, min_size=1, overlap=1))
+    assert fragments == ["A a a.", "B b b.", "C c c."]
+
+
+def test_overlap_resets_after_oversize_sentence():
+    text = "A a. B b. X x x x x x. C c. D d."
+    fragments = list(fragmenter.iter_fragments(text, max_size=4, min_size=1, overlap=1))
+    assert fragments == ["A a. B b.", "X x x x x x.", "C c. D d."]
+
+
+def test_custom_token_counter():
+    # Un "token" por carácter que no es espacio
+    counter = fragmenter.make_token_counter(lambda text: [c for c in text if not c.isspace()])
+    text = "Abc. Defgh. Ij. Klmnopq."
+    fragments = list(fragmenter.iter_fragments(text, max_size=10, min_size=1, counter=counter))
+    assert fragments == ["Abc. Defgh.", "Ij.", "Klmnopq."]
+
+
+def test_custom_token_counter_matches_word_counter():
+    text = synthetic_article(words=3000, seed=7)
+    counter = fragmenter.make_token_counter(str.split)
+    assert list(fragmenter.iter_fragments(text, counter=counter)) == list(fragmenter.iter_fragments(text))
@@ -0,0 +1,73 @@
+import json
+import mongomock
+import pytest
+import gemini
+import generation_cache
+import main
+import resources
+import storage
+from fake_gemini import FakeGeminiServer
+
+QUERIES = {"economia": ["subida de tipos"], "deportes": ["final de copa"]}
+
+
+def fake_retrieve_all(queries_by_category):
+    for category_name, queries in queries_by_category.items():
+        for query in queries:
+            yield category_name, query, {"texts": [f"Fragmento sobre {query}."], "urls": [f"https://example.com/{category_name}"]}
+
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    with FakeGeminiServer(polls_until_done=2) as server:
+        monkeypatch.setattr(gemini, "GEMINI_BASE_URL", server.url)
+        monkeypatch.setattr(gemini, "GEMINI_API_KEY", "fake-key")
+        monkeypatch.setattr(generation_cache, "GENERATION_CACHE_ENABLED", False)
+        monkeypatch.setattr(main, "GEMINI_BATCH_FILE", str(tmp_path / "batch.jsonl"))
+        monkeypatch.setattr(main, "GEMINI_BATCH_POLL_INTERVAL", 0)
+        monkeypatch.setattr(main, "retrieve_all", fake_retrieve_all)
+        resources.reset("gemini")
+        resources.override("mongo", mongomock.MongoClient())
+        yield server
+    resources.reset("gemini")
+    resources.reset("mongo")
+
+
+def test_generate_articles_batch_round_trip(server, tmp_path):
+    path = tmp_path / "requests.jsonl"
+    results = gemini.generate_articles_batch([("0", ["Uno."], "español"), ("1", ["Dos."], "inglés")], str(path), poll_interval=0)
+
+    lines = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [line["key"] for line in lines] == ["0", "1"]
+    assert all(line["request"]["contents"] and line["request"]["generationConfig"] for line in lines)
+    assert set(results) == {"0", "1"}
+    assert json.loads(results["0"])["title"] == "Artículo 0"
+    # El trabajo se consulta hasta que termina y después se descargan sus resultados
+    polls = [path for method, path in server.requests if method == "GET" and "/batches/" in path]
+    assert len(polls) == 2
+    assert server.requests[-1][1].endswith(":download")
+
+
+def test_failed_request_has_no_result(server, tmp_path):
+    server.responder = lambda key, request: None if key == "1" else json.dumps({"title": key})
+    results = gemini.generate_articles_batch([("0", ["Uno."], "español"), ("1", ["Dos."], "inglés")],
+                                             str(tmp_path / "requests.jsonl"), poll_interval=0)
+    assert results == {"0": json.dumps({"title": "0"}), "1": None}
+
+
+def test_batch_mode_inserts_articles(server):
+    pending = main.generate_and_insert_mongodb_batch(QUERIES)
+
+    assert pending == []
+    articles = list(storage.get_database()["articles"].find())
+    assert len(articles) == len(QUERIES) * len(main.LANGUAGES)
+    assert {article["category"] for article in articles} == set(QUERIES)
+    assert all(article["urls"] for article in articles)
+
+
+def test_batch_mode_leaves_failed_articles_pending(server):
+    server.responder = lambda key, request: None if key == "0" else json.dumps({"title": f"Artículo {key}"})
+    pending = main.generate_and_insert_mongodb_batch(QUERIES)
+
+    assert len(pending) == 1
+    assert storage.get_database()["articles"].count_documents({}) == len(QUERIES) * len(main.LANGUAGES) - 1
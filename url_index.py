@@ -0,0 +1,189 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import telemetry
+import resources
+
+resources.load_env()
+
+logger = logging.getLogger(__name__)
+
+# Índice persistente de URLs entre ejecuciones (hash del contenido y categorías de cada artículo)
+URL_INDEX_ENABLED = os.environ.get('URL_INDEX_ENABLED', '1') == '1'
+URL_INDEX_PATH = os.environ.get('URL_INDEX_PATH', '.cache/url_index.sqlite3')
+# No se vuelven a fragmentar ni a insertar los artículos cuyo contenido y categorías no han cambiado
+URL_INDEX_SKIP_UNCHANGED = os.environ.get('URL_INDEX_SKIP_UNCHANGED', '1') == '1'
+# Las URLs que no aparecen en ninguna portada durante este tiempo (segundos) se olvidan
+URL_INDEX_TTL = float(os.environ.get('URL_INDEX_TTL', 14 * 24 * 3600))
+
+_lock = threading.Lock()
+_conn = None
+
+
+def _connect():
+    global _conn
+    if _conn is None:
+        directory = os.path.dirname(URL_INDEX_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _conn = sqlite3.connect(URL_INDEX_PATH, check_same_thread=False)
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                content_hash TEXT,
+                categories TEXT,
+                sections TEXT,
+                first_seen REAL,
+                last_seen REAL
+            )
+        """)
+        _conn.execute("DELETE FROM urls WHERE last_seen < ?", (time.time() - URL_INDEX_TTL,))
+        _conn.commit()
+    return _conn
+
+
+def content_hash(text):
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def lookup(urls):
+    """
+    Devuelve {url: {"hash", "categories"}} de las URLs registradas en ejecuciones anteriores.
+    """
+    if not URL_INDEX_ENABLED or not urls:
+        return {}
+    urls = list(urls)
+    found = {}
+    with _lock:
+        conn = _connect()
+        # SQLite limita el número de parámetros por consulta
+        for i in range(0, len(urls), 500):
+            chunk = urls[i:i + 500]
+            rows = conn.execute(
+                f"SELECT url, content_hash, categories FROM urls WHERE url IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for url, hash, categories in rows:
+                found[url] = {"hash": hash, "categories": json.loads(categories)}
+    return found
+
+
+def record(entries):
+    """
+    Guarda el hash y las categorías de las URLs de una ejecución (la salida de
+    URLIndex.to_records). Se llama cuando sus fragmentos ya están en Qdrant, para
+    que una ingesta fallida no marque como procesado un contenido que no lo está.
+    """
+    if not URL_INDEX_ENABLED or not entries:
+        return
+    now = time.time()
+    rows = [
+        (url, entry["hash"], json.dumps(entry["categories"]), json.dumps(entry["sections"]), now, now)
+        for url, entry in entries.items()
+        if entry.get("hash")
+    ]
+    with _lock:
+        conn = _connect()
+        conn.executemany("""
+            INSERT INTO urls (url, content_hash, categories, sections, first_seen, last_seen)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                content_hash = excluded.content_hash,
+                categories = excluded.categories,
+                sections = excluded.sections,
+                last_seen = excluded.last_seen
+        """, rows)
+        conn.commit()
+
+
+class URLIndex:
+    """
+    Índice de las URLs de artículos de una ejecución.
+
+    Cada URL se descarga una sola vez aunque aparezca en varias portadas de sección;
+    el índice guarda todas las secciones y categorías en las que apareció, que se
+    añaden a sus fragmentos. Al terminar el crawl, las URLs cuyo contenido (hash del
+    texto extraído) y categorías coinciden con los de la ejecución anterior se marcan
+    como sin cambios para no volver a fragmentarlas ni insertarlas, siempre que sus
+    puntos sigan en la colección: has_points(urls) devuelve las que tienen alguno
+    (p.ej. qdrant.urls_with_points). Sin has_points no se omite ninguna URL, porque
+    el índice conserva URLs cuyos puntos ya pueden haber caducado.
+    """
+
+    def __init__(self, skip_unchanged=URL_INDEX_SKIP_UNCHANGED, has_points=None):
+        self.skip_unchanged = skip_unchanged
+        self.has_points = has_points
+        self._lock = threading.Lock()
+        # {url: {"categories": [...], "sections": [...], "hash": str | None}}
+        self.entries = {}
+        self.unchanged = set()
+
+    def claim(self, url, section_url, category):
+        """
+        Registra que url aparece en section_url. Devuelve True solo la primera vez,
+        cuando hay que descargarla.
+        """
+        with self._lock:
+            entry = self.entries.get(url)
+            first = entry is None
+            if first:
+                entry = self.entries[url] = {"categories": [], "sections": [], "hash": None}
+            if category not in entry["categories"]:
+                entry["categories"].append(category)
+            if section_url not in entry["sections"]:
+                entry["sections"].append(section_url)
+        if not first:
+            telemetry.increment("crawl_duplicate_urls_total")
+        return first
+
+    def set_content(self, url, text):
+        with self._lock:
+            self.entries[url]["hash"] = content_hash(text)
+
+    def compare_with_previous(self):
+        """
+        Marca como sin cambios las URLs con el mismo hash y sin categorías nuevas
+        respecto a la ejecución anterior y que aún tienen puntos. Devuelve cuántas son.
+        """
+        if not self.skip_unchanged or self.has_points is None:
+            return 0
+        previous = lookup(self.entries)
+        with self._lock:
+            candidates = {
+                url for url, entry in self.entries.items()
+                if url in previous and entry["hash"] and previous[url]["hash"] == entry["hash"]
+                and set(entry["categories"]) <= set(previous[url]["categories"])
+            }
+        if candidates:
+            try:
+                candidates &= self.has_points(candidates)
+            except Exception as e:
+                logger.warning(f"No se pudo comprobar qué artículos siguen en la colección ({e}); se procesan todos.")
+                candidates = set()
+        with self._lock:
+            self.unchanged = candidates
+        telemetry.increment("crawl_unchanged_urls_total", len(self.unchanged))
+        return len(self.unchanged)
+
+    def annotate(self, url, fragments):
+        """
+        Añade a los fragmentos de url todas las categorías y secciones en las que apareció.
+        """
+        entry = self.entries[url]
+        return [
+            dict(fragment, categories=list(entry["categories"]), sections=list(entry["sections"]))
+            for fragment in fragments
+        ]
+
+    def to_records(self):
+        """
+        Estado serializable en JSON (para el checkpoint del crawl y para record).
+        """
+        with self._lock:
+            return {
+                url: dict(entry, unchanged=url in self.unchanged)
+                for url, entry in self.entries.items()
+            }